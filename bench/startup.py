@@ -0,0 +1,86 @@
+"""Startup-time benchmark of the qevals CLI, checked against a per-command budget.
+
+Run with `python -m bench.startup`. Each command is started --repeat times as
+`python -m qevals <command> --dry-run`, which reads the config and imports what the configured
+providers and metrics need, then exits. The median wall time is compared with the command's
+budget, the slowest imports of the last run are listed, and the exit status is 1 if any command
+is over budget. Without --config the template is used, with the mock provider and two metrics.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+DEFAULT_BUDGETS = {'datagen': 2.0, 'eval': 4.0}
+DEFAULT_TESTS = ["AnswerRelevancy", "Correctness"]
+TEMPLATE_PATH = os.path.join('config', 'config.toml.template')
+IMPORT_TIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+def make_config(path, tests=DEFAULT_TESTS):
+    with open(TEMPLATE_PATH) as f:
+        template = f.read()
+    template = template.replace('GEN_PROVIDER = ""', 'GEN_PROVIDER = "mock"')
+    template = template.replace('EVAL_PROVIDER = ""', 'EVAL_PROVIDER = "mock"')
+    template = re.sub(r'EVAL_TESTS = \[.*\]', 'EVAL_TESTS = [' + ','.join(f'"{test}"' for test in tests) + ']', template)
+    with open(path, 'w') as f:
+        f.write(template)
+
+def slowest_imports(importtime_output, top):
+    """Returns the top-level imports with the largest cumulative time, in seconds."""
+    imports = []
+    for line in importtime_output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        # Nested imports are indented, only those made directly by the command are kept
+        if match and len(match.group(3)) <= 1:
+            imports.append((int(match.group(2)) / 1e6, match.group(4)))
+    return sorted(imports, reverse=True)[:top]
+
+def measure(command, config_path, repeat):
+    times = []
+    importtime_output = ''
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'qevals', '--config', config_path, '--dry-run', command],
+                                capture_output=True, text=True)
+        times.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            raise RuntimeError(f"qevals {command} --dry-run failed:\n{result.stderr[-2000:]}")
+        importtime_output = result.stderr
+    return times, importtime_output
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--commands', nargs='+', default=list(DEFAULT_BUDGETS), choices=list(DEFAULT_BUDGETS))
+    parser.add_argument('--config', help="config to start with, defaults to the template with mock providers")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, help="budget in seconds for every command, instead of the defaults")
+    parser.add_argument('--top', type=int, default=10, help="number of slowest imports to list")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = args.config
+        if config_path is None:
+            config_path = os.path.join(tmp_dir, 'config.toml')
+            make_config(config_path)
+
+        over_budget = []
+        for command in args.commands:
+            budget = args.budget or DEFAULT_BUDGETS[command]
+            times, importtime_output = measure(command, config_path, args.repeat)
+            median = statistics.median(times)
+            status = "ok" if median <= budget else "OVER BUDGET"
+            print(f"{command}: median {median:.2f}s, min {min(times):.2f}s, budget {budget:.2f}s ({status})")
+            for seconds, module in slowest_imports(importtime_output, args.top):
+                print(f"    {seconds:6.3f}s  {module}")
+            if median > budget:
+                over_budget.append(command)
+
+    if over_budget:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
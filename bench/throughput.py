@@ -0,0 +1,169 @@
+"""End-to-end throughput benchmark of datagen and eval against the offline mock provider.
+
+Run with `python -m bench.throughput`. For every corpus size a synthetic corpus is generated,
+pushed through stream_synthetic_data and the resulting dataset through base_tests, reporting
+rows/sec, peak traced memory and the p50/p99 end-to-end latency of each generation call and eval row.
+"""
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import mlflow
+
+import config
+from client.llm_client import LLMClient
+from client.mock_llm import mock_stats
+from client.telemetry import telemetry
+from datagen.datagen import ROOT_DATA_DIR, stream_synthetic_data
+from datagen.utils.sink import count_rows, open_dataset
+from eval.eval_tests import base_tests
+
+DEFAULT_SIZES = [50, 200, 1000]
+DEFAULT_TESTS = ["AnswerRelevancy", "Faithfulness", "Correctness"]
+CHUNKS_PER_FILE = 20
+CHUNK_SIZE = 500
+# Spans timing each unit of work of a stage end to end: rate limiter waits, retries, parsing and judging included
+LATENCY_SPANS = {
+    'datagen': ['question_gen', 'question_gen_batch', 'answer_gen'],
+    'eval': ['eval.row'],
+}
+
+def make_corpus(corpus_dir, n_chunks, seed=0):
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(5000)]
+    os.makedirs(corpus_dir, exist_ok=True)
+    for file_index in range(max(1, n_chunks // CHUNKS_PER_FILE)):
+        paragraphs = []
+        for _ in range(CHUNKS_PER_FILE):
+            words = []
+            while sum(len(word) + 1 for word in words) < CHUNK_SIZE - 20:
+                words.append(rng.choice(vocabulary))
+            paragraphs.append(' '.join(words) + '.')
+        with open(os.path.join(corpus_dir, f"doc_{file_index}.txt"), 'w') as f:
+            f.write('\n'.join(paragraphs))
+
+def measure(stage, run):
+    mock_stats.reset()
+    telemetry.reset()
+    tracemalloc.start()
+    started = time.perf_counter()
+    rows = run()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = {}
+    for name in LATENCY_SPANS[stage]:
+        if telemetry.samples.get(name):
+            samples = np.asarray(telemetry.samples[name])
+            latencies[name] = {'count': len(samples),
+                               'p50': float(np.percentile(samples, 50)),
+                               'p99': float(np.percentile(samples, 99))}
+    return {
+        'stage': stage,
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_sec': rows / seconds if seconds else 0.0,
+        'calls': mock_stats.calls,
+        'rate_limited': mock_stats.rate_limited,
+        'errors': mock_stats.errors,
+        'latency': latencies,
+        'peak_memory_mb': peak / 2 ** 20,
+    }
+
+def configure(args):
+    mock_config = {
+        'MOCK_LATENCY_MEDIAN': args.latency,
+        'MOCK_LATENCY_SIGMA': args.latency_sigma,
+        'MOCK_ERROR_RATE': args.error_rate,
+        'MOCK_RATE_LIMIT_RATE': args.rate_limit_rate,
+        'MOCK_SEED': args.seed,
+    }
+    config.config['CACHE'] = {'ENABLED': False}
+    # Spans are timed, but nothing is exported
+    telemetry.enabled = True
+    telemetry.exports = []
+    telemetry.samples = {}
+    config.config.setdefault('DATAGEN', {}).update(mock_config, GEN_PROVIDER='mock', CHUNK_SIZE=CHUNK_SIZE, CHUNK_OVERLAP=0)
+    config.config.setdefault('EVAL', {}).update(mock_config, EVAL_PROVIDER='mock')
+    LLMClient.reset()
+
+def run_size(size, args, work_dir):
+    corpus_dir = os.path.join(work_dir, f"corpus_{size}")
+    output_path = os.path.join(work_dir, f"dataset_{size}.parquet")
+    make_corpus(corpus_dir, size, seed=args.seed)
+
+    def datagen_stage():
+        stream_synthetic_data(os.path.relpath(corpus_dir, ROOT_DATA_DIR), 'mock', output_path)
+        rows = count_rows(output_path)
+        if not rows:
+            raise RuntimeError(f"Datagen produced no rows from {corpus_dir}, nothing to benchmark")
+        return rows
+
+    def eval_stage():
+        eval_dataset = open_dataset(output_path)
+        results = base_tests(gen_provider='mock',
+                             eval_provider='mock',
+                             eval_dataset=eval_dataset,
+                             test_list=args.tests,
+                             use_answers_from_dataset=True,
+                             max_concurrent_rows=args.eval_rows,
+                             max_concurrent_judge_calls=args.eval_judge_calls)
+        return len(results)
+
+    results = [measure('datagen', datagen_stage)]
+    if not args.skip_eval:
+        results.append(measure('eval', eval_stage))
+    for result in results:
+        result['size'] = size
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="corpus sizes, in chunks")
+    parser.add_argument('--tests', nargs='+', default=DEFAULT_TESTS)
+    parser.add_argument('--latency', type=float, default=0.05, help="median mock call latency in seconds")
+    parser.add_argument('--latency-sigma', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--eval-rows', type=int, default=4)
+    parser.add_argument('--eval-judge-calls', type=int, default=16)
+    parser.add_argument('--skip-eval', action='store_true')
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    configure(args)
+    # Datagen only reads corpora under ROOT_DATA_DIR, so the work directory is made there
+    os.makedirs(ROOT_DATA_DIR, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix='qevals_bench_', dir=ROOT_DATA_DIR)
+    mlflow.set_tracking_uri(f"file://{os.path.join(work_dir, 'mlruns')}")
+
+    results = []
+    try:
+        for size in args.sizes:
+            results.extend(run_size(size, args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'stage':<8} {'size':>6} {'rows':>6} {'rows/s':>8} {'calls':>6} {'429s':>5} {'peak MB':>8}")
+    for r in results:
+        print(f"{r['stage']:<8} {r['size']:>6} {r['rows']:>6} {r['rows_per_sec']:>8.2f} {r['calls']:>6} {r['rate_limited']:>5} "
+              f"{r['peak_memory_mb']:>8.1f}")
+    print(f"\n{'stage':<8} {'size':>6} {'span':<20} {'count':>6} {'p50 s':>7} {'p99 s':>7}")
+    for r in results:
+        for name, latency in r['latency'].items():
+            print(f"{r['stage']:<8} {r['size']:>6} {name:<20} {latency['count']:>6} {latency['p50']:>7.3f} {latency['p99']:>7.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
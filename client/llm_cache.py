@@ -0,0 +1,155 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+from client.rate_limiter import admit_pending
+
+DEFAULT_CACHE_PATH = './.cache/llm_cache.sqlite'
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 100000
+# A full cache is evicted down to this fraction of max_entries, so eviction runs once per batch of inserts
+EVICT_TO = 0.9
+# Hits are written back in batches, the access order lags by at most this many hits
+TOUCH_BATCH_SIZE = 256
+# Without max_entries, expired entries are purged every this many inserts
+PURGE_INTERVAL = 1000
+
+class SQLiteLLMCache(BaseCache):
+    """On-disk LLM response cache keyed by a hash of the client identity and the rendered prompt.
+
+    The langchain ``llm_string`` already carries the model and sampling params, ``identity``
+    adds what it does not (provider, deployment, API version).
+
+    Entries are evicted least recently used first once there are more than max_entries, and by
+    age past ttl_seconds. Hits only update the access time in memory, it is written back every
+    TOUCH_BATCH_SIZE hits, on the next insert and on stats() or flush().
+    """
+
+    def __init__(self,
+                 path: str = DEFAULT_CACHE_PATH,
+                 ttl_seconds: Optional[int] = DEFAULT_TTL_SECONDS,
+                 max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+                 identity: Optional[dict] = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.identity = json.dumps(identity or {}, sort_keys=True)
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}
+        self._inserts = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, "
+            "response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed_at ON llm_cache (accessed_at)")
+        self._conn.commit()
+        self.entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        payload = "\x1f".join([self.identity, llm_string, prompt])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._touched.pop(key, None)
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.entries -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._touched[key] = now
+                if len(self._touched) >= TOUCH_BATCH_SIZE:
+                    self._flush_touched()
+                    self._conn.commit()
+        if row is None:
+            # Only a call that reaches the provider waits for the rate limiter
+            admit_pending()
+            return None
+        return [loads(generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        response = json.dumps([dumps(generation) for generation in return_val])
+        with self._lock:
+            self._touched.pop(key, None)
+            self._flush_touched()
+            exists = self._conn.execute("SELECT 1 FROM llm_cache WHERE key = ?", (key,)).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            if not exists:
+                self.entries += 1
+                self._inserts += 1
+            if (self.max_entries and self.entries > self.max_entries) or \
+                    (not self.max_entries and self.ttl_seconds and self._inserts >= PURGE_INTERVAL):
+                self._evict(now)
+            self._conn.commit()
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._conn.executemany("UPDATE llm_cache SET accessed_at = ? WHERE key = ?",
+                                   [(accessed_at, key) for key, accessed_at in self._touched.items()])
+            self._touched = {}
+
+    def _evict(self, now: float) -> None:
+        self._inserts = 0
+        if self.ttl_seconds:
+            self.entries -= self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        if self.max_entries and self.entries > self.max_entries:
+            # Least recently used entries go first, read off the accessed_at index
+            excess = self.entries - int(self.max_entries * EVICT_TO)
+            self.entries -= self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY accessed_at LIMIT ?)",
+                (excess,)
+            ).rowcount
+
+    def flush(self) -> None:
+        """Writes back the access times of the hits since the last write."""
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._touched = {}
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self.entries = 0
+
+    def stats(self) -> dict:
+        self.flush()
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': self.entries,
+        }
@@ -1,34 +1,154 @@
 import os
-from pyexpat import model
-import subprocess
-from sys import api_version
+import importlib
+import threading
+from typing import TYPE_CHECKING
 
-from networkx import project
-from Delphic.config.api.auth import api_key
 import config
+from client.rate_limiter import AdaptiveRateLimiter, DEFAULT_INITIAL_CONCURRENCY, DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_RETRIES
 
-import vertexai
-from langchain_openai.chat_models import AzureChatOpenAI, ChatOpenAI
-from langchain_google_vertexai import VertexAI
-from google.oauth2.credentials import Credentials
-from openai import AzureOpenAI
+if TYPE_CHECKING:
+    import httpx
+    from langchain_openai.chat_models import AzureChatOpenAI
+    from langchain_google_vertexai import VertexAI
+    from client.mock_llm import MockChatModel
 
 os.environ['SSL_CERT_FILE'] = config.config['MISC']['SSL_CERT_FILE']
 
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+
+# Provider -> (modules its client needs, LLMClient method building it). The provider SDKs are only
+# imported once a provider is used, so a run pays for the one it is configured with
+PROVIDERS = {
+    'azure': (('httpx', 'langchain_openai.chat_models'), 'get_openai_client'),
+    'vertex': (('vertexai', 'langchain_google_vertexai'), 'get_vertexai_client'),
+    'mock': (('client.mock_llm',), 'get_mock_client'),
+}
+
 class LLMClient:
+    # Process-wide registry shared by every LLMClient instance, keyed by (provider, function)
+    _clients = {}
+    _rate_limiters = {}
+    _caches = {}
+    _clients_lock = threading.RLock()
+    _http_client = None
+
     def __init__(self):
-        self.api_key = config.config['MISC']['API_KEY']
+        self.api_key = config.config['MISC'].get('API_KEY')
+
+    def get_client(self, provider, function):
+        key = (provider, function)
+        client = LLMClient._clients.get(key)
+        if client is not None:
+            return client
+        with LLMClient._clients_lock:
+            if key not in LLMClient._clients:
+                if provider not in PROVIDERS:
+                    raise ValueError(f"Unsupported provider: {provider}")
+                LLMClient._clients[key] = getattr(self, PROVIDERS[provider][1])(function)
+            return LLMClient._clients[key]
+
+    @staticmethod
+    def load_provider(provider):
+        """Imports the modules the provider's client needs, without building it."""
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unsupported provider: {provider}")
+        for module in PROVIDERS[provider][0]:
+            importlib.import_module(module)
+
+    def get_rate_limiter(self, provider, function) -> AdaptiveRateLimiter:
+        # One limiter per deployment, shared by every caller of that deployment in the process
+        key = (provider, function)
+        with LLMClient._clients_lock:
+            if key not in LLMClient._rate_limiters:
+                function_config = config.config.get(function, {})
+                LLMClient._rate_limiters[key] = AdaptiveRateLimiter(
+                    requests_per_minute=function_config.get('RATE_LIMIT_RPM'),
+                    tokens_per_minute=function_config.get('RATE_LIMIT_TPM'),
+                    initial_concurrency=function_config.get('RATE_LIMIT_INITIAL_CONCURRENCY', DEFAULT_INITIAL_CONCURRENCY),
+                    max_concurrency=function_config.get('RATE_LIMIT_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY),
+                    max_retries=function_config.get('RATE_LIMIT_MAX_RETRIES', DEFAULT_MAX_RETRIES),
+                    name=function,
+                    # With the response cache on, calls it answers skip the budgets
+                    deferred=config.config.get('CACHE', {}).get('ENABLED', False),
+                    )
+            return LLMClient._rate_limiters[key]
+
+    def get_gen_client(self, gen_provider):
+        return self.get_client(gen_provider, 'DATAGEN')
+
+    def get_eval_client(self, eval_provider):
+        return self.get_client(eval_provider, 'EVAL')
+
+    @classmethod
+    def get_http_client(cls) -> 'httpx.Client':
+        import httpx
+
+        # A single pooled HTTP client keeps TLS connections alive across all Azure clients
+        with cls._clients_lock:
+            if cls._http_client is None:
+                cls._http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS)
+                    )
+            return cls._http_client
+
+    @classmethod
+    def reset(cls):
+        with cls._clients_lock:
+            cls._clients = {}
+            cls._rate_limiters = {}
+            cls._caches = {}
+            if cls._http_client is not None:
+                cls._http_client.close()
+                cls._http_client = None
+
+    def get_cache(self, provider, function):
+        cache_config = config.config.get('CACHE', {})
+        if not cache_config.get('ENABLED', False):
+            return None
+        from client.llm_cache import SQLiteLLMCache, DEFAULT_CACHE_PATH, DEFAULT_TTL_SECONDS, DEFAULT_MAX_ENTRIES
+
+        identity = {
+            'provider': provider,
+            'function': function,
+            'model': config.config[function].get('MODEL'),
+            'api_version': config.config[function].get('API_VERSION'),
+        }
+        cache = SQLiteLLMCache(
+            path=cache_config.get('PATH', DEFAULT_CACHE_PATH),
+            ttl_seconds=cache_config.get('TTL_SECONDS', DEFAULT_TTL_SECONDS),
+            max_entries=cache_config.get('MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+            identity=identity,
+            )
+        with LLMClient._clients_lock:
+            LLMClient._caches[(provider, function)] = cache
+        return cache
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        """Returns the stats of the response cache of each client built so far, keyed by function."""
+        with cls._clients_lock:
+            caches = dict(cls._caches)
+        return {function: cache.stats() for (_, function), cache in caches.items()}
+
+    def get_openai_client(self, function) -> 'AzureChatOpenAI':
+        from langchain_openai.chat_models import AzureChatOpenAI
 
-    def get_openai_client(self, function) -> AzureChatOpenAI:
         client = AzureChatOpenAI(
             api_key=self.api_key,
             azure_endpoint=config.config[function]['AZURE_ENDPOINT'],
             model=config.config[function]['MODEL'],
-            api_version=config.config[function]['API_VERSION']
+            api_version=config.config[function]['API_VERSION'],
+            cache=self.get_cache('azure', function),
+            http_client=self.get_http_client(),
             )
         return client
     
-    def get_vertexai_client(self, function) -> VertexAI:
+    def get_vertexai_client(self, function) -> 'VertexAI':
+        import vertexai
+        from langchain_google_vertexai import VertexAI
+
         vertexai.init(
             api_key=self.api_key,
             project=config.config[function]['PROJECT'],
@@ -37,5 +157,20 @@ class LLMClient:
         )
         client = VertexAI(
             model_name=config.config[function]['MODEL'],
+            cache=self.get_cache('vertex', function),
             )
-        return client
\ No newline at end of file
+        return client
+
+    def get_mock_client(self, function) -> 'MockChatModel':
+        from client.mock_llm import MockChatModel
+
+        function_config = config.config.get(function, {})
+        client = MockChatModel(
+            latency_median=function_config.get('MOCK_LATENCY_MEDIAN', 0.2),
+            latency_sigma=function_config.get('MOCK_LATENCY_SIGMA', 0.5),
+            error_rate=function_config.get('MOCK_ERROR_RATE', 0.0),
+            rate_limit_rate=function_config.get('MOCK_RATE_LIMIT_RATE', 0.0),
+            seed=function_config.get('MOCK_SEED', 0),
+            cache=self.get_cache('mock', function),
+            )
+        return client
@@ -0,0 +1,160 @@
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from client.rate_limiter import estimate_tokens
+
+class MockProviderError(Exception):
+    status_code = 500
+
+    def __init__(self, message, headers=None):
+        super().__init__(message)
+        self.headers = headers or {}
+
+class MockRateLimitError(MockProviderError):
+    status_code = 429
+
+class MockStats(object):
+    """Latency and outcome of every mock call in the process, for benchmarks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latencies = []
+            self.calls = 0
+            self.errors = 0
+            self.rate_limited = 0
+
+    def record(self, latency, error=None):
+        with self._lock:
+            self.calls += 1
+            self.latencies.append(latency)
+            if isinstance(error, MockRateLimitError):
+                self.rate_limited += 1
+            elif error is not None:
+                self.errors += 1
+
+mock_stats = MockStats()
+
+_rngs = {}
+_rngs_lock = threading.Lock()
+
+def draw(seed):
+    """Returns the next uniform draw of the per-seed generator behind latencies and failures."""
+    with _rngs_lock:
+        if seed not in _rngs:
+            _rngs[seed] = random.Random(seed)
+        rng = _rngs[seed]
+        return rng.random(), rng.lognormvariate(0.0, 1.0)
+
+LIST_KEYS = ['statements', 'truths', 'claims', 'opinions', 'steps']
+
+def mock_response(prompt: str, seed: int = 0) -> str:
+    """Builds a deterministic JSON reply that satisfies the schema the prompt asks for.
+
+    Covers the datagen question/answer/packed-question prompts, the generation prompt and the
+    deepeval judge prompts (statements, truths, claims, opinions, steps, verdicts, score, reason)
+    and the fused multi-criteria judge prompt.
+    """
+    digest = hashlib.sha256(f"{seed}:{prompt}".encode('utf-8')).hexdigest()
+    rng = random.Random(digest)
+    words = re.findall(r'\w+', prompt)
+    topic = ' '.join(words[-8:]) if words else 'the context'
+
+    if 'contexts:' in prompt and 'questions' in prompt:
+        ids = re.findall(r'^\s*\[(\d+)\]', prompt, re.MULTILINE)
+        return json.dumps({'questions': {i: f"Mock question {digest[:8]}-{i} about the context?" for i in ids}})
+
+    if 'one key per criterion' in prompt:
+        names = re.findall(r'^- (\w+):', prompt, re.MULTILINE)
+        return json.dumps({name: {'score': rng.randint(0, 10), 'reason': f"Mock reason {digest[:8]} for {name}."} for name in names})
+
+    keys = []
+    listed = re.search(r'following keys:\s*\n((?:[ \t]*\w+[ \t]*\n?)+)', prompt)
+    if listed:
+        keys = re.findall(r'\w+', listed.group(1))
+    else:
+        keys = [key for key in LIST_KEYS + ['verdicts', 'score', 'reason'] if f'"{key}"' in prompt]
+
+    reply = {}
+    for key in keys:
+        if key == 'question':
+            reply[key] = f"Mock question {digest[:8]}: what does the context say about {topic}?"
+        elif key == 'answer':
+            reply[key] = f"Mock answer {digest[:8]} about {topic}."
+        elif key in LIST_KEYS:
+            reply[key] = [f"Mock {key[:-1]} {digest[:8]}-{i}." for i in range(rng.randint(1, 3))]
+        elif key == 'verdicts':
+            reply[key] = [{'verdict': 'yes' if rng.random() < 0.8 else 'no', 'reason': f"Mock reason {digest[:8]}-{i}."}
+                          for i in range(rng.randint(1, 3))]
+        elif key == 'score':
+            reply[key] = rng.randint(0, 10)
+        elif key == 'reason':
+            reply[key] = f"Mock reason {digest[:8]}."
+        else:
+            reply[key] = f"Mock {key} {digest[:8]}."
+    if not reply:
+        reply['answer'] = f"Mock answer {digest[:8]} about {topic}."
+    return json.dumps(reply)
+
+class MockChatModel(BaseChatModel):
+    """Offline chat model with seeded outputs, lognormal latency and injected 5xx/429 failures."""
+
+    model_name: str = 'mock'
+    latency_median: float = 0.2
+    latency_sigma: float = 0.5
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    seed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return 'mock'
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {'model_name': self.model_name, 'seed': self.seed}
+
+    def _plan_call(self):
+        failure, spread = draw(self.seed)
+        latency = self.latency_median * spread ** self.latency_sigma
+        error = None
+        if failure < self.rate_limit_rate:
+            error = MockRateLimitError("Mock rate limit exceeded", headers={'retry-after': str(self.retry_after)})
+        elif failure < self.rate_limit_rate + self.error_rate:
+            error = MockProviderError("Mock provider error")
+        return latency, error
+
+    def _result(self, messages: List[BaseMessage], latency, error) -> ChatResult:
+        mock_stats.record(latency, error)
+        if error is not None:
+            raise error
+        prompt = '\n'.join(str(message.content) for message in messages)
+        content = mock_response(prompt, self.seed)
+        # Estimated the way the rate limiter does, so token accounting can be exercised offline
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(content)
+        usage = {'input_tokens': input_tokens, 'output_tokens': output_tokens, 'total_tokens': input_tokens + output_tokens}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=usage))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        latency, error = self._plan_call()
+        time.sleep(latency)
+        return self._result(messages, latency, error)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        latency, error = self._plan_call()
+        await asyncio.sleep(latency)
+        return self._result(messages, latency, error)
@@ -0,0 +1,203 @@
+import time
+import random
+import threading
+import contextvars
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from client.telemetry import telemetry
+
+CHARS_PER_TOKEN = 4
+BURST_SECONDS = 10
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MAX_CONCURRENCY = 64
+
+# Set while a deferred limiter runs a call, the response cache admits the call into the budgets on a miss
+pending_admission = contextvars.ContextVar('pending_admission', default=None)
+
+def admit_pending():
+    """Lets the call in progress into its limiter's budgets, if the limiter is waiting for a cache miss."""
+    admit = pending_admission.get()
+    if admit is not None:
+        admit()
+
+def estimate_tokens(value):
+    return max(1, len(str(value)) // CHARS_PER_TOKEN)
+
+def get_status_code(error):
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status_code is None and ('429' in str(error) or 'rate limit' in str(error).lower()):
+        status_code = 429
+    return status_code
+
+def get_retry_after(error):
+    """Returns the Retry-After of a provider error in seconds, or None if it has none."""
+    headers = getattr(error, 'headers', None) or getattr(getattr(error, 'response', None), 'headers', None) or {}
+    value = None
+    for key in ('retry-after-ms', 'retry-after', 'Retry-After'):
+        if key in headers:
+            value = headers[key]
+            if key == 'retry-after-ms':
+                try:
+                    return float(value) / 1000
+                except ValueError:
+                    value = None
+            break
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(status_code):
+    return status_code is not None and (status_code in (408, 409, 429) or status_code >= 500)
+
+class TokenBucket(object):
+    """Refills at per_minute / 60 per second and holds at most BURST_SECONDS worth of tokens."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount=1.0):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def debit(self, amount):
+        # Lets usage reported after a call correct the estimate taken before it, possibly into debt
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+
+class AdaptiveRateLimiter(object):
+    """Request and token budgets plus AIMD concurrency for one provider deployment.
+
+    Calls wait for a concurrency slot and for the requests/min and tokens/min buckets. A 429 halves
+    the concurrency limit (at most once per base_delay) and is retried after Retry-After, or after a
+    jittered exponential backoff when the provider gives none. 5xx and timeouts are retried the same
+    way without touching the limit. Every success grows the limit by 1/limit, about one slot per
+    round of calls, up to max_concurrency.
+
+    name is the config section of the deployment, under which telemetry prices its token usage.
+
+    With deferred set, as when the deployment's client has a response cache, a call only takes a slot
+    and budget once the cache misses, so cached responses neither wait nor count in telemetry.
+    """
+
+    def __init__(self,
+                 requests_per_minute=None,
+                 tokens_per_minute=None,
+                 initial_concurrency=DEFAULT_INITIAL_CONCURRENCY,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY,
+                 name=None,
+                 deferred=False):
+        self.name = name
+        self.deferred = deferred
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.limit = float(min(initial_concurrency, max_concurrency))
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.in_flight = 0
+        self.throttled = 0
+        self.retried = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def _acquire_slot(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def _release_slot(self, throttled):
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttled += 1
+                if now - self._last_decrease >= self.base_delay:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def backoff(self, attempt, retry_after=None):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = random.uniform(delay / 2, delay)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def call(self, fn, tokens=1):
+        """Runs fn within the budgets, retrying throttled and transient failures."""
+        for attempt in range(self.max_retries + 1):
+            admitted = []
+
+            def admit():
+                if admitted:
+                    return
+                self._acquire_slot()
+                admitted.append(True)
+                if self.requests is not None:
+                    self.requests.acquire(1)
+                if self.tokens is not None:
+                    self.tokens.acquire(tokens)
+
+            throttled = False
+            context_token = pending_admission.set(admit) if self.deferred else None
+            try:
+                if not self.deferred:
+                    admit()
+                result = fn()
+            except Exception as e:
+                status_code = get_status_code(e)
+                throttled = status_code == 429
+                if not is_retryable(status_code) or attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt, get_retry_after(e))
+            else:
+                if not admitted:
+                    # Served by the response cache without reaching the provider
+                    return result
+                usage = getattr(result, 'usage_metadata', None)
+                if self.tokens is not None and usage and usage.get('total_tokens'):
+                    self.tokens.debit(usage['total_tokens'] - tokens)
+                telemetry.record_usage(result, self.name)
+                return result
+            finally:
+                if context_token is not None:
+                    pending_admission.reset(context_token)
+                if admitted:
+                    self._release_slot(throttled)
+            self.retried += 1
+            time.sleep(delay)
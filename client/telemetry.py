@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime
+
+import config
+
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0]
+DEFAULT_OUTPUT_DIR = './telemetry'
+DEFAULT_EXPORTS = ['json', 'prometheus', 'mlflow']
+
+# Reused by every span while telemetry is off, so a disabled span costs one attribute check
+NULL_SPAN = nullcontext()
+
+current_stage = ContextVar('current_stage', default=None)
+
+def token_usage(response):
+    """Returns the (input, output) token counts reported in a langchain response, or None."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage:
+        return usage.get('input_tokens', 0), usage.get('output_tokens', 0)
+    token_usage = (getattr(response, 'response_metadata', None) or {}).get('token_usage')
+    if token_usage:
+        return token_usage.get('prompt_tokens', 0), token_usage.get('completion_tokens', 0)
+    return None
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class StageStats(object):
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def percentile(self, q):
+        """Estimates a latency percentile by interpolating within its histogram bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.buckets):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.max_seconds
+                return min(self.max_seconds, lower + (upper - lower) * (rank - seen) / bucket_count)
+            seen += bucket_count
+        return self.max_seconds
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_seconds': self.total_seconds,
+            'mean_seconds': self.total_seconds / self.count if self.count else None,
+            'p50_seconds': self.percentile(0.5),
+            'p95_seconds': self.percentile(0.95),
+            'p99_seconds': self.percentile(0.99),
+            'max_seconds': self.max_seconds,
+            'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], self.buckets)),
+            'llm_calls': self.calls,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cost': self.cost,
+        }
+
+class Telemetry(object):
+    """Process-wide timing spans, latency histograms and LLM token usage, grouped by stage.
+
+    Tokens reported by a provider response are attributed to the innermost span open in the calling
+    context, and priced with the COST_PER_1K_*_TOKENS keys of the config section that made the call.
+    While disabled, span() hands back a shared no-op context and nothing is recorded.
+    """
+
+    def __init__(self, enabled=False, output_dir=DEFAULT_OUTPUT_DIR, exports=None):
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.exports = DEFAULT_EXPORTS if exports is None else exports
+        self.stages = {}
+        # Set to a dict to also keep every observed duration by stage, for exact percentiles
+        self.samples = None
+        self._lock = threading.Lock()
+
+    def _stage(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages.setdefault(name, StageStats())
+        return stats
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        token = current_stage.set(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+            current_stage.reset(token)
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._stage(name).observe(seconds)
+            if self.samples is not None:
+                self.samples.setdefault(name, []).append(seconds)
+
+    def record_usage(self, response, function=None):
+        """Adds the token usage of a provider response to the current stage."""
+        if not self.enabled:
+            return
+        usage = token_usage(response)
+        function_config = config.config.get(function, {}) if function else {}
+        cost = 0.0
+        if usage is not None:
+            cost = (usage[0] * function_config.get('COST_PER_1K_INPUT_TOKENS', 0)
+                    + usage[1] * function_config.get('COST_PER_1K_OUTPUT_TOKENS', 0)) / 1000
+        with self._lock:
+            stats = self._stage(current_stage.get() or (function or 'llm').lower())
+            stats.calls += 1
+            if usage is not None:
+                stats.input_tokens += usage[0]
+                stats.output_tokens += usage[1]
+                stats.cost += cost
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in sorted(self.stages.items())}
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            if self.samples is not None:
+                self.samples = {}
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP qevals_stage_seconds Latency of the instrumented stages.",
+            "# TYPE qevals_stage_seconds histogram",
+        ]
+        snapshot = self.snapshot()
+        for name, stats in snapshot.items():
+            stage = escape_label(name)
+            cumulative = 0
+            for bound, bucket_count in stats['buckets'].items():
+                cumulative += bucket_count
+                lines.append(f'qevals_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'qevals_stage_seconds_sum{{stage="{stage}"}} {stats["total_seconds"]}')
+            lines.append(f'qevals_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        for metric, key, help_text in [("qevals_llm_calls_total", 'llm_calls', "LLM calls made in the stage."),
+                                       ("qevals_input_tokens_total", 'input_tokens', "Input tokens reported by the provider."),
+                                       ("qevals_output_tokens_total", 'output_tokens', "Output tokens reported by the provider."),
+                                       ("qevals_cost_total", 'cost', "Token cost at the configured prices.")]:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for name, stats in snapshot.items():
+                lines.append(f'{metric}{{stage="{escape_label(name)}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+    def log_mlflow(self):
+        """Logs the per-stage summary to the active MLflow run."""
+        import mlflow
+
+        metrics = {}
+        for name, stats in self.snapshot().items():
+            for key in ('count', 'mean_seconds', 'p50_seconds', 'p95_seconds', 'p99_seconds',
+                        'llm_calls', 'input_tokens', 'output_tokens', 'cost'):
+                if stats[key] is not None:
+                    metrics[f"telemetry.{name}.{key}"] = stats[key]
+        if metrics:
+            mlflow.log_metrics(metrics)
+
+    def export(self, prefix) -> list:
+        """Writes the JSON and Prometheus exports under output_dir and returns their paths."""
+        if not self.enabled:
+            return []
+        paths = []
+        base = os.path.join(self.output_dir, f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        if 'json' in self.exports or 'prometheus' in self.exports:
+            os.makedirs(self.output_dir, exist_ok=True)
+        if 'json' in self.exports:
+            with open(f"{base}.json", 'w') as f:
+                json.dump(self.snapshot(), f, indent=2)
+            paths.append(f"{base}.json")
+        if 'prometheus' in self.exports:
+            with open(f"{base}.prom", 'w') as f:
+                f.write(self.to_prometheus())
+            paths.append(f"{base}.prom")
+        if paths:
+            print(f"Telemetry written to {', '.join(paths)}")
+        return paths
+
+telemetry_config = config.config.get('TELEMETRY', {})
+telemetry = Telemetry(enabled=telemetry_config.get('ENABLED', False),
+                      output_dir=telemetry_config.get('OUTPUT_DIR', DEFAULT_OUTPUT_DIR),
+                      exports=telemetry_config.get('EXPORTS', DEFAULT_EXPORTS))
@@ -0,0 +1,20 @@
+"""Loads the TOML config into `config`, a dict of sections.
+
+The file is config/config.toml, unless the QEVALS_CONFIG environment variable points to another one.
+"""
+import os
+
+try:
+    import tomllib
+except ModuleNotFoundError:
+    import tomli as tomllib
+
+CONFIG_PATH = os.environ.get('QEVALS_CONFIG') or os.path.join(os.path.dirname(__file__), 'config.toml')
+
+def load(path: str = CONFIG_PATH) -> dict:
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Config file {path} not found, copy config/config.toml.template to create it")
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+config = load()
@@ -1,16 +1,26 @@
 import config
-from datasets import Dataset as ds
 from datetime import datetime
 
-from datagen import create_synthetic_data
+from datagen.datagen import stream_synthetic_data, refresh_synthetic_data
 
 data_corpus_dir = config.config['DATAGEN']['DATA_DIR']
 gen_provider = config.config['DATAGEN']['GEN_PROVIDER']
 
-synthetic_dataset = create_synthetic_data(data_corpus_dir=data_corpus_dir,
-                                          gen_provider=gen_provider)
+# Point OUTPUT_PATH at the dataset of an interrupted run to resume it
+current_date = datetime.now().strftime('%Y%m%d_%H%M%S')
+output_path = config.config['DATAGEN'].get('OUTPUT_PATH') or f"./datagen/qac_out/eval_dataset_{current_date}.parquet"
 
-print(synthetic_dataset[0])
+# Point PREVIOUS_PATH at an earlier dataset to only regenerate what changed in the corpus since
+previous_path = config.config['DATAGEN'].get('PREVIOUS_PATH')
 
-current_date = datetime.now().strftime('%Y%m%d_%H%M%S')
-synthetic_dataset.to_csv(f"./datagen/qac_out/eval_dataset_{current_date}.csv")
+if previous_path:
+    refresh_synthetic_data(data_corpus_dir=data_corpus_dir,
+                           gen_provider=gen_provider,
+                           previous_path=previous_path,
+                           output_path=output_path)
+else:
+    stream_synthetic_data(data_corpus_dir=data_corpus_dir,
+                          gen_provider=gen_provider,
+                          output_path=output_path)
+
+print(f"Synthetic dataset written to {output_path}")
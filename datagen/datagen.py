@@ -1,64 +1,106 @@
-import os
-import time
-import pandas as pd
-from functools import partial
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 import config
-from datasets import Dataset
 from client.llm_client import LLMClient
-from datagen.utils import read_files
-from datagen.prompt import find_prompt
-from datagen.dataprep import convert_to_text, preprocess
-from langchain.prompts import ChatPromptTemplate
-from langchain.output_parsers import ResponseSchema
-from langchain.output_parsers import StructuredOutputParser
+from client.rate_limiter import estimate_tokens
+from client.telemetry import telemetry
+from datagen.utils import files
+from datagen.utils.sink import ParquetSink, iter_rows, export_dataset
+from datagen.utils.manifest import chunk_hash, load_manifest, save_manifest, scan_files
+from datagen.prompt import find_template, get_output_parser
+from datagen.dataprep import convert_to_text, iter_loaded_files, preprocess
+from datagen.dedup import get_deduplicator
+from datagen.selection import get_selector
+
+if TYPE_CHECKING:
+    from datasets import Dataset
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_QUESTION_BATCH_SIZE = 1
+DEFAULT_WINDOW_SIZE = 256
+ROOT_DATA_DIR = './datagen/data/'
+
+def get_max_concurrency():
+    return config.config['DATAGEN'].get('MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)
+
+def get_question_batch_size():
+    return config.config['DATAGEN'].get('QUESTION_BATCH_SIZE', DEFAULT_QUESTION_BATCH_SIZE)
 
 def question_gen(docs, bare_template, gen_provider):
     print("Generating questions")
     print(f"Using {gen_provider}")
 
-    question_response_schemas = [
-        ResponseSchema(name="question", description="question about the context."),
-    ]
-    
-    question_output_parser = StructuredOutputParser.from_response_schemas(question_response_schemas)
-    format_instructions = question_output_parser.get_format_instructions()
+    question_output_parser, format_instructions = get_output_parser(
+        ("question", "question about the context."),
+    )
 
     question_generation_llm = LLMClient().get_gen_client(gen_provider=gen_provider)
+    rate_limiter = LLMClient().get_rate_limiter(gen_provider, 'DATAGEN')
 
-    qa_template = find_prompt("system", "professor_q")
-
-    print(f"Using template: {qa_template}")
-
-    prompt_template = ChatPromptTemplate.from_template(template=qa_template)
-
-    messages = prompt_template.format_messages(
-        context=docs[0],
-        format_instructions=format_instructions
-    )
+    prompt_template = find_template("system", "professor_q")
 
     question_generation_chain = bare_template | question_generation_llm
 
-    qac_triples = []
-
-    for text in docs:
+    def generate_question(text):
         messages = prompt_template.format_messages(
             context=text,
             format_instructions=format_instructions
         )
         try:
-            if gen_provider == "azure":
-                response = question_generation_chain.invoke({"content": messages})
-                output_dict = question_output_parser.parse(response.content)
-            elif gen_provider == "vertex":
-                response = question_generation_chain.invoke({"content": messages})
+            with telemetry.span('question_gen'):
+                response = rate_limiter.call(lambda: question_generation_chain.invoke({"content": messages}),
+                                             tokens=estimate_tokens(messages))
                 output_dict = question_output_parser.parse(response.content)
+            output_dict["context"] = text
         except Exception as e:
             print(e)
             output_dict = {
                 "question": "",
-                "text": text,
+                "context": text,
             }
-        qac_triples.append(output_dict)
+        return output_dict
+
+    batch_size = get_question_batch_size()
+
+    # executor.map yields results in the order of docs, whatever order the calls complete in
+    if batch_size > 1:
+        batch_question_output_parser, batch_format_instructions = get_output_parser(
+            ("questions", "object mapping each context id to a question about that context.", "object"),
+        )
+        batch_prompt_template = find_template("system", "professor_q_batch")
+
+        def generate_question_pack(pack):
+            contexts = "\n\n".join(f"[{i}] {text.page_content}" for i, text in enumerate(pack))
+            messages = batch_prompt_template.format_messages(
+                contexts=contexts,
+                format_instructions=batch_format_instructions
+            )
+            try:
+                with telemetry.span('question_gen_batch'):
+                    response = rate_limiter.call(lambda: question_generation_chain.invoke({"content": messages}),
+                                                 tokens=estimate_tokens(messages))
+                    questions = batch_question_output_parser.parse(response.content)["questions"]
+            except Exception as e:
+                print(e)
+                questions = {}
+
+            # Chunks the pack did not answer for are retried on their own
+            pack_triples = []
+            for i, text in enumerate(pack):
+                question = questions.get(str(i)) if isinstance(questions, dict) else None
+                if isinstance(question, str) and question:
+                    pack_triples.append({"question": question, "context": text})
+                else:
+                    pack_triples.append(generate_question(text))
+            return pack_triples
+
+        packs = [docs[i:i + batch_size] for i in range(0, len(docs), batch_size)]
+        with ThreadPoolExecutor(max_workers=get_max_concurrency()) as executor:
+            qac_triples = [triple for pack_triples in executor.map(generate_question_pack, packs) for triple in pack_triples]
+    else:
+        with ThreadPoolExecutor(max_workers=get_max_concurrency()) as executor:
+            qac_triples = list(executor.map(generate_question, docs))
     
     return qac_triples
 
@@ -67,50 +109,41 @@ def answer_gen(qac_triples, bare_template, gen_provider):
     print(f"Using {gen_provider}")
 
     answer_generation_llm = LLMClient().get_gen_client(gen_provider=gen_provider)
+    rate_limiter = LLMClient().get_rate_limiter(gen_provider, 'DATAGEN')
 
-    answer_schema = ResponseSchema(
-        name="answer",
-        description="An answer to the question"
+    answer_output_parser, format_instructions = get_output_parser(
+        ("answer", "An answer to the question"),
     )
 
-    answer_response_schemas = [
-        answer_schema,
-    ]
-
-    answer_output_parser = StructuredOutputParser.from_response_schemas(answer_response_schemas)
-    format_instructions = answer_output_parser.get_format_instructions()
-
-    qa_template = find_prompt("system", "professor_a")
-
-    print(f"Using template: {qa_template}")
-
-    prompt_template = ChatPromptTemplate.from_template(template=qa_template)
-
-    messages = prompt_template.format_messages(
-        context=qac_triples[0]["context"],
-        question=qac_triples[0]["question"],
-        format_instructions=format_instructions
-    )
+    prompt_template = find_template("system", "professor_a")
 
     answer_generation_chain = bare_template | answer_generation_llm
 
-    for triple in qac_triples:
+    def generate_answer(triple):
         messages = prompt_template.format_messages(
             context=triple["context"],
             question=triple["question"],
             format_instructions=format_instructions
         )
         try:
-            response = answer_generation_chain.invoke({"content": messages})
-            output_dict = answer_output_parser.parse(response.content)
+            with telemetry.span('answer_gen'):
+                response = rate_limiter.call(lambda: answer_generation_chain.invoke({"content": messages}),
+                                             tokens=estimate_tokens(messages))
+                output_dict = answer_output_parser.parse(response.content)
             print(output_dict)
         except Exception as e:
-            continue
+            print(e)
+            return
         triple["ground_truth"] = output_dict["answer"]
 
+    with ThreadPoolExecutor(max_workers=get_max_concurrency()) as executor:
+        list(executor.map(generate_answer, qac_triples))
+
     return qac_triples
 
 def ground_truth_gen(qac_triples):
+    import pandas as pd
+
     print("Setting ground truth")
     try:
         ground_truth_qac_set = pd.DataFrame(qac_triples)
@@ -124,11 +157,13 @@ def ground_truth_gen(qac_triples):
 def get_metadata(file_path):
     return {"file_path": file_path}
 
-def create_synthetic_data(data_corpus_dir, gen_provider) -> Dataset:
-    ROOT_DATA_DIR = './datagen/data/'
+def create_synthetic_data(data_corpus_dir, gen_provider) -> 'Dataset':
+    from datasets import Dataset
+    from langchain.prompts import ChatPromptTemplate
+
     path = ROOT_DATA_DIR + data_corpus_dir
     print(path)
-    path_list = files.process_paths(path)
+    path_list = files.process_paths([path])
 
     print(f"Converting data in {path_list} to text...")
     doc_list = convert_to_text(path_list)
@@ -136,6 +171,16 @@ def create_synthetic_data(data_corpus_dir, gen_provider) -> Dataset:
     print(f"Sample: {doc_list[0]}")
     docs = preprocess(doc_list)
 
+    deduplicator = get_deduplicator()
+    if deduplicator is not None:
+        docs = list(deduplicator.filter(docs))
+        report = deduplicator.report()
+        print(f"Deduplication removed {report['removed_exact']} exact and {report['removed_near']} near duplicate(s)")
+
+    selector = get_selector()
+    if selector is not None:
+        docs = selector.select(docs)
+
     for doc in docs:
         print(doc.metadata)
 
@@ -151,5 +196,176 @@ def create_synthetic_data(data_corpus_dir, gen_provider) -> Dataset:
 
     ground_truth_qac_set = ground_truth_gen(qac_triples_qa)
     eval_dataset = Dataset.from_pandas(ground_truth_qac_set)
+    telemetry.export('datagen')
 
     return eval_dataset
+
+def iter_chunks(path_list):
+    """Yields chunks one file at a time, in the order of path_list."""
+    for file_path, doc_list, error in iter_loaded_files(path_list):
+        for chunk in preprocess(doc_list):
+            yield chunk
+
+def iter_recorded(iterable, seen):
+    for item in iterable:
+        seen.append(item)
+        yield item
+
+def iter_windows(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        window = list(itertools.islice(iterator, size))
+        if not window:
+            return
+        yield window
+
+def to_row(triple, chunk_id):
+    chunk = triple["context"]
+    row = {
+        "chunk_id": chunk_id,
+        "chunk_hash": chunk_hash(chunk.page_content),
+        "question": triple["question"],
+        "context": str(chunk.page_content),
+        "ground_truth": triple.get("ground_truth", ""),
+    }
+    row.update(get_metadata(chunk.metadata.get("source", "")))
+    return row
+
+def generate_rows(items, bare_template, gen_provider, window_size=DEFAULT_WINDOW_SIZE):
+    """Generates QA rows for a (chunk_id, item) stream, yielding (last chunk id, rows) per window.
+
+    An item is either a chunk to generate for or a row carried over from a previous dataset.
+    """
+    for window in iter_windows(items, window_size):
+        pending = [(chunk_id, item) for chunk_id, item in window if not isinstance(item, dict)]
+        generated = {}
+        if pending:
+            qac_triples_q = question_gen([chunk for _, chunk in pending], bare_template, gen_provider)
+            qac_triples_qa = answer_gen(qac_triples_q, bare_template, gen_provider)
+            generated = {chunk_id: to_row(triple, chunk_id) for (chunk_id, _), triple in zip(pending, qac_triples_qa)}
+
+        rows = [generated[chunk_id] if chunk_id in generated else dict(item, chunk_id=chunk_id) for chunk_id, item in window]
+        yield window[-1][0], rows
+
+def manifest_path_for(output_path):
+    return output_path + '.manifest.json'
+
+def dedup_report_path_for(output_path):
+    return output_path + '.dedup.json'
+
+def selection_report_path_for(output_path):
+    return output_path + '.selection.json'
+
+def write_manifest(output_path, files_manifest):
+    for entry in files_manifest.values():
+        entry['chunks'] = []
+    for row in iter_rows(output_path, columns=["file_path", "chunk_hash"]):
+        if row["file_path"] in files_manifest:
+            files_manifest[row["file_path"]]['chunks'].append(row["chunk_hash"])
+    save_manifest(manifest_path_for(output_path), {'files': files_manifest})
+
+def write_rows(items, gen_provider, output_path):
+    from langchain.prompts import ChatPromptTemplate
+
+    window_size = config.config['DATAGEN'].get('WINDOW_SIZE', DEFAULT_WINDOW_SIZE)
+
+    bare_prompt_template = "{content}"
+    bare_template = ChatPromptTemplate.from_template(template=bare_prompt_template)
+
+    with ParquetSink(output_path) as sink:
+        if sink.last_chunk_id >= 0:
+            print(f"Resuming after chunk {sink.last_chunk_id}")
+        items = itertools.islice(enumerate(items), sink.last_chunk_id + 1, None)
+        for last_chunk_id, rows in generate_rows(items, bare_template, gen_provider, window_size):
+            sink.append(rows, last_chunk_id)
+            print(f"Produced rows up to chunk {last_chunk_id}")
+
+def export_rows(output_path):
+    for export_format in config.config['DATAGEN'].get('EXPORT_FORMATS', []):
+        print(f"Exported dataset to {export_dataset(output_path, export_format)}")
+
+def stream_synthetic_data(data_corpus_dir, gen_provider, output_path) -> str:
+    """Streams the corpus through generation into a Parquet dataset at output_path.
+
+    Only one window of chunks is held in memory at a time. Rerunning with the same output_path
+    resumes after the last chunk recorded in its checkpoint. Once done, a manifest of the corpus
+    is written next to the output for refresh_synthetic_data.
+
+    With chunk selection on, the corpus is read twice: once to choose the chunks and once more to
+    generate for them, so the chunks themselves are never all held in memory.
+    """
+    path = ROOT_DATA_DIR + data_corpus_dir
+
+    # Files are loaded as soon as they are downloaded or extracted, path_list fills up as they are
+    path_list = []
+    chunks = iter_chunks(iter_recorded(files.iter_paths([path]), path_list))
+    deduplicator = get_deduplicator()
+    if deduplicator is not None:
+        chunks = deduplicator.filter(chunks)
+
+    selector = get_selector()
+    if selector is not None:
+        selector.fit(chunk.page_content for chunk in chunks)
+        # Duplicates need no second filtering, a chunk is only kept the first time its text is seen
+        chunks = selector.filter(iter_chunks(path_list))
+
+    write_rows(chunks, gen_provider, output_path)
+    if deduplicator is not None:
+        deduplicator.save_report(dedup_report_path_for(output_path))
+    if selector is not None:
+        selector.save_report(selection_report_path_for(output_path))
+
+    files_manifest, _, _ = scan_files(path_list, {})
+    write_manifest(output_path, files_manifest)
+    export_rows(output_path)
+    telemetry.export('datagen')
+
+    return output_path
+
+def iter_refresh_items(path_list, files_manifest, changed, previous_path, deduplicator=None):
+    reusable_rows = {}
+
+    # Rows of unchanged files are carried over as they are, rows of deleted files are dropped
+    for row in iter_rows(previous_path):
+        if row["file_path"] not in files_manifest:
+            continue
+        if row["file_path"] in changed:
+            reusable_rows[row["chunk_hash"]] = row
+        else:
+            if deduplicator is not None:
+                deduplicator.add(row["context"], row["file_path"])
+            yield row
+
+    # Changed files are re-chunked, and only chunks whose text is new go to generation
+    chunks = iter_chunks([path for path in path_list if path in changed])
+    if deduplicator is not None:
+        chunks = deduplicator.filter(chunks)
+    for chunk in chunks:
+        row = reusable_rows.get(chunk_hash(chunk.page_content))
+        if row is not None:
+            yield dict(row, **get_metadata(chunk.metadata.get("source", "")))
+        else:
+            yield chunk
+
+def refresh_synthetic_data(data_corpus_dir, gen_provider, previous_path, output_path) -> str:
+    """Regenerates only what changed in the corpus since the dataset at previous_path was made.
+
+    New and modified files are loaded and chunked again, rows for unchanged chunks are reused and
+    rows from files no longer in the corpus are dropped. The merged dataset goes to output_path.
+    """
+    path = ROOT_DATA_DIR + data_corpus_dir
+    path_list = files.process_paths([path])
+
+    previous_manifest = load_manifest(manifest_path_for(previous_path))
+    files_manifest, changed, deleted = scan_files(path_list, previous_manifest['files'])
+    print(f"{len(changed)} new or changed file(s), {len(deleted)} deleted file(s)")
+
+    deduplicator = get_deduplicator()
+    write_rows(iter_refresh_items(path_list, files_manifest, changed, previous_path, deduplicator), gen_provider, output_path)
+    if deduplicator is not None:
+        deduplicator.save_report(dedup_report_path_for(output_path))
+    write_manifest(output_path, files_manifest)
+    export_rows(output_path)
+    telemetry.export('datagen')
+
+    return output_path
@@ -1,30 +1,84 @@
 import os
+import time
+import itertools
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import config
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, UnstructuredMarkdownLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from client.telemetry import telemetry
 
-def convert_to_text(path_array):
+def load_file(file):
+    # Imported here, so only the loader worker processes pay for the document loaders
+    from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, UnstructuredMarkdownLoader, TextLoader
+
+    if file.endswith('.pdf'):
+        loader = PyPDFLoader(file)
+    elif file.endswith('.docx') or file.endswith('.doc'):
+        loader = Docx2txtLoader(file)
+    elif file.endswith('.md'):
+        loader = UnstructuredMarkdownLoader(file)
+    elif file.endswith('.txt'):
+        loader = TextLoader(file)
+    else:
+        print(f"File: {file} not supported")
+        return []
+
+    return loader.load()
+
+def load_file_safe(file):
+    # Timed in the worker process, the parent records it since telemetry is per process
+    started = time.perf_counter()
+    try:
+        return file, load_file(file), None, time.perf_counter() - started
+    except Exception as e:
+        return file, [], f"{type(e).__name__}: {e}", time.perf_counter() - started
+
+def get_load_workers():
+    return config.config['DATAGEN'].get('LOAD_WORKERS') or os.cpu_count()
+
+def iter_loaded_files(path_array, max_workers=None, ordered=True):
+    """Parses files on a process pool, yielding (file, docs, error) as each file is done.
+
+    With ordered=True results come back in the order of path_array, otherwise in completion order.
+    At most twice max_workers files are in flight, so a slow consumer does not pile up parsed docs.
+    """
+    max_workers = max_workers or get_load_workers()
+    paths = iter(path_array)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = [executor.submit(load_file_safe, file) for file in itertools.islice(paths, 2 * max_workers)]
+        while pending:
+            if ordered:
+                finished = [pending.pop(0)]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                finished = [future for future in pending if future in done]
+                pending = [future for future in pending if future not in done]
+            for future in finished:
+                file, docs, error, seconds = future.result()
+                telemetry.observe('load', seconds)
+                if error is not None:
+                    print(f"File: {file} could not be loaded: {error}")
+                yield file, docs, error
+                next_file = next(paths, None)
+                if next_file is not None:
+                    pending.append(executor.submit(load_file_safe, next_file))
+
+def convert_to_text(path_array, max_workers=None):
     doc_list = []
+    errors = []
 
-    for file in os.listdir(path_array):
-        if file.endswith('.pdf'):
-            loader = PyPDFLoader(file)
-            doc_list.extend(loader.load())
-        elif file.endswith('.docx') or file.endswith('.doc'):
-            loader = Docx2txtLoader(file)
-            doc_list.extend(loader.load())
-        elif file.endswith('.md'):
-            loader = UnstructuredMarkdownLoader(file)
-            doc_list.extend(loader.load())
-        elif file.endswith('.txt'):
-            loader = TextLoader(file)
-            doc_list.extend(loader.load())
-        else:
-            print(f"File: {file} not supported")
+    for file, docs, error in iter_loaded_files(path_array, max_workers=max_workers):
+        doc_list.extend(docs)
+        if error is not None:
+            errors.append((file, error))
+
+    if errors:
+        print(f"{len(errors)} file(s) could not be loaded")
 
     return doc_list
 
 def preprocess(doc_list):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
     separators = [' ', '.', ',', '\n', ';', ':']
     chunked_docs = []
 
@@ -32,6 +86,7 @@ def preprocess(doc_list):
                                                     chunk_overlap=config.config['DATAGEN']['CHUNK_OVERLAP'],
                                                     separators=separators)
 
-    chunked_docs = text_splitter.split_documents(doc_list)
+    with telemetry.span('chunk'):
+        chunked_docs = text_splitter.split_documents(doc_list)
 
     return chunked_docs
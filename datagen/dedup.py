@@ -0,0 +1,120 @@
+import re
+import json
+import zlib
+import numpy as np
+import config
+from datagen.utils.manifest import chunk_hash
+
+MERSENNE_PRIME = (1 << 31) - 1
+SHINGLE_SIZE = 3
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_NUM_PERM = 128
+
+def shingles(text, size=SHINGLE_SIZE):
+    words = re.findall(r'\w+', text.lower())
+    if len(words) <= size:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def lsh_params(threshold, num_perm):
+    """Picks the (bands, rows) split of the signature whose LSH threshold is closest to threshold."""
+    best = None
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+class Deduplicator(object):
+    """Drops exact and near-duplicate chunks, keeping the first occurrence.
+
+    Exact duplicates are found by content hash. Near duplicates are found with MinHash signatures
+    over word shingles and banded LSH. Candidates sharing a band are kept apart only if their
+    estimated Jaccard similarity is below threshold. Hashing is seeded, so a rerun over the same
+    corpus keeps the same chunks.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM, seed=1):
+        rng = np.random.RandomState(seed)
+        self.threshold = threshold
+        self.a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.hashes = {}
+        self.buckets = [{} for _ in range(self.bands)]
+        self.signatures = []
+        self.sources = []
+        self.kept = 0
+        self.removed = []
+
+    def signature(self, text):
+        shingle_hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles(text)), dtype=np.uint64)
+        return ((np.outer(shingle_hashes, self.a) + self.b) % MERSENNE_PRIME).min(axis=0).astype(np.uint32)
+
+    def band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, text, source='', signature=None):
+        signature = self.signature(text) if signature is None else signature
+        index = len(self.signatures)
+        self.signatures.append(signature)
+        self.sources.append(source)
+        for band, key in enumerate(self.band_keys(signature)):
+            self.buckets[band].setdefault(key, []).append(index)
+        self.hashes[chunk_hash(text)] = source
+
+    def check(self, text, source=''):
+        """Returns a removal record if text duplicates a chunk seen before, otherwise indexes it and returns None."""
+        exact = self.hashes.get(chunk_hash(text))
+        if exact is not None:
+            return {'source': source, 'kind': 'exact', 'duplicate_of': exact, 'similarity': 1.0}
+
+        signature = self.signature(text)
+        candidates = set()
+        for band, key in enumerate(self.band_keys(signature)):
+            candidates.update(self.buckets[band].get(key, ()))
+        if candidates:
+            candidates = sorted(candidates)
+            similarities = (np.stack([self.signatures[c] for c in candidates]) == signature).mean(axis=1)
+            best = int(similarities.argmax())
+            if similarities[best] >= self.threshold:
+                return {'source': source, 'kind': 'near', 'duplicate_of': self.sources[candidates[best]],
+                        'similarity': float(similarities[best])}
+
+        self.add(text, source, signature)
+        return None
+
+    def filter(self, chunks):
+        for chunk in chunks:
+            duplicate = self.check(chunk.page_content, chunk.metadata.get('source', ''))
+            if duplicate is None:
+                self.kept += 1
+                yield chunk
+            else:
+                duplicate['chunk_hash'] = chunk_hash(chunk.page_content)
+                self.removed.append(duplicate)
+
+    def report(self):
+        exact = sum(1 for duplicate in self.removed if duplicate['kind'] == 'exact')
+        return {
+            'kept': self.kept,
+            'removed_exact': exact,
+            'removed_near': len(self.removed) - exact,
+            'threshold': self.threshold,
+            'removed': self.removed,
+        }
+
+    def save_report(self, path):
+        report = self.report()
+        print(f"Deduplication kept {report['kept']} chunk(s), removed {report['removed_exact']} exact and {report['removed_near']} near duplicate(s)")
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+def get_deduplicator():
+    if not config.config['DATAGEN'].get('DEDUP', False):
+        return None
+    return Deduplicator(threshold=config.config['DATAGEN'].get('DEDUP_THRESHOLD', DEFAULT_THRESHOLD),
+                        num_perm=config.config['DATAGEN'].get('DEDUP_NUM_PERM', DEFAULT_NUM_PERM))
@@ -1,14 +1,88 @@
+import os
 import csv
+import time
+import hashlib
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from langchain.prompts import ChatPromptTemplate
 
 PROMPTS_TEMPLATE = './datagen/prompts/template.csv'
+MTIME_CHECK_INTERVAL = 1.0
+
+class PromptRegistry(object):
+    """Prompts of a template CSV indexed by (role, function), with their compiled ChatPromptTemplates.
+
+    The file is read once and only read again when its mtime changes, which is checked at most
+    every MTIME_CHECK_INTERVAL seconds. version is a hash of the file contents, for use in cache keys.
+    """
+
+    def __init__(self, csv_file=PROMPTS_TEMPLATE):
+        self.csv_file = csv_file
+        self.prompts = {}
+        self.templates = {}
+        self.version = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < MTIME_CHECK_INTERVAL:
+            return
+        with self._lock:
+            mtime = os.stat(self.csv_file).st_mtime
+            self._checked_at = now
+            if mtime == self._mtime:
+                return
+            with open(self.csv_file, 'rb') as file:
+                content = file.read()
+            prompts = {}
+            reader = csv.reader(content.decode('utf-8').splitlines(keepends=True))
+            next(reader)
+            for row in reader:
+                role, function, prompt = row
+                prompts.setdefault((role, function), prompt)
+            self.prompts = prompts
+            self.templates = {}
+            self.version = hashlib.sha256(content).hexdigest()
+            self._mtime = mtime
+
+    def get_prompt(self, role, function):
+        self._refresh()
+        return self.prompts.get((role, function))
+
+    def get_template(self, role, function) -> 'ChatPromptTemplate':
+        from langchain.prompts import ChatPromptTemplate
+
+        self._refresh()
+        key = (role, function)
+        template = self.templates.get(key)
+        if template is None and key in self.prompts:
+            template = ChatPromptTemplate.from_template(template=self.prompts[key])
+            self.templates[key] = template
+        return template
+
+    def get_version(self):
+        self._refresh()
+        return self.version
+
+prompt_registry = PromptRegistry()
 
 def find_prompt(target_role, target_function):
-    csv_file = PROMPTS_TEMPLATE
-    with open(csv_file, newline='') as file:
-        reader = csv.reader(file)
-        next(reader)
-        for row in reader:
-            role, function, prompt = row
-            if role == target_role and function == target_function:
-                return prompt
-    return None
+    return prompt_registry.get_prompt(target_role, target_function)
+
+def find_template(target_role, target_function) -> 'ChatPromptTemplate':
+    return prompt_registry.get_template(target_role, target_function)
+
+@lru_cache(maxsize=None)
+def get_output_parser(*schemas):
+    """Returns a StructuredOutputParser and its format instructions for (name, description[, type]) schemas."""
+    from langchain.output_parsers import ResponseSchema, StructuredOutputParser
+
+    response_schemas = [ResponseSchema(name=schema[0], description=schema[1], type=schema[2] if len(schema) > 2 else "string")
+                        for schema in schemas]
+    output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
+    return output_parser, output_parser.get_format_instructions()
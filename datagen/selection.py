@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import zlib
+import hashlib
+import tempfile
+import numpy as np
+import config
+
+DEFAULT_DIM = 512
+DEFAULT_DIVERSITY = 1.0
+DEFAULT_BATCH_SIZE = 64
+POOL_FACTOR = 4
+BLOCK_ROWS = 65536
+# Weight of centrality when diversity is 1, so ties, such as the first pick, go to the more central chunk
+TIE_BREAK = 1e-3
+
+def tokens(text):
+    return re.findall(r'\w+', text.lower())
+
+def text_key(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class ChunkSelector(object):
+    """Picks a target number of diverse yet representative chunks from a corpus.
+
+    Chunks are embedded offline with signed feature hashing of their words into dim buckets,
+    weighted by sublinear TF-IDF and L2 normalised. The matrix is written to a memory-mapped file,
+    so only one block of rows is in memory at a time.
+
+    Selection is MMR against the corpus centroid: each pick maximises
+    (1 - diversity) * similarity to the centroid + diversity * distance to the closest chosen chunk.
+    diversity=1, the default, is greedy k-center, which covers the most topics. Lower values favour
+    chunks typical of the corpus over outlying ones.
+
+    Scores only ever go down, so after a scan of the matrix up to batch_size picks are made from a
+    pool of the best candidates, for as long as the best pool score still beats the best score
+    outside the pool. The result is the exact greedy selection, with far fewer scans than picks.
+    """
+
+    def __init__(self, target, dim=DEFAULT_DIM, diversity=DEFAULT_DIVERSITY, batch_size=DEFAULT_BATCH_SIZE, work_dir=None):
+        self.target = target
+        self.dim = dim
+        self.diversity = diversity
+        self.batch_size = batch_size
+        self.work_dir = work_dir
+        self.selected_keys = set()
+        self.stats = {}
+
+    def vectorize(self, text):
+        """Returns the signed, sublinear TF row of text and the buckets it touches."""
+        row = np.zeros(self.dim, dtype=np.float32)
+        hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens(text)), dtype=np.uint32)
+        # The top bit of the hash signs the token, so colliding words tend to cancel out rather than add up
+        signs = ((hashes >> 31) & 1) * 2.0 - 1.0
+        counts = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim)
+        buckets = np.flatnonzero(counts)
+        row[buckets] = np.sign(counts[buckets]) * (1 + np.log(np.abs(counts[buckets])))
+        return row, buckets
+
+    def embed(self, texts, path):
+        """Writes the TF-IDF matrix of texts to path and returns it memory-mapped, with each text's key."""
+        document_frequency = np.zeros(self.dim, dtype=np.int64)
+        keys = []
+        with open(path, 'wb') as f:
+            for text in texts:
+                row, buckets = self.vectorize(text)
+                document_frequency[buckets] += 1
+                keys.append(text_key(text))
+                f.write(row.tobytes())
+
+        n = len(keys)
+        if n == 0:
+            return np.zeros((0, self.dim), dtype=np.float32), np.array(keys, dtype=np.uint64)
+        matrix = np.memmap(path, dtype=np.float32, mode='r+', shape=(n, self.dim))
+        idf = (np.log((1 + n) / (1 + document_frequency)) + 1).astype(np.float32)
+        for start in range(0, n, BLOCK_ROWS):
+            block = matrix[start:start + BLOCK_ROWS] * idf
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            matrix[start:start + BLOCK_ROWS] = block / np.maximum(norms, 1e-12)
+        matrix.flush()
+        return matrix, np.array(keys, dtype=np.uint64)
+
+    def select_indices(self, matrix):
+        """Returns the sorted row indices of the chosen chunks and records coverage stats."""
+        n = matrix.shape[0]
+        k = min(self.target, n)
+        relevance = np.empty(n, dtype=np.float32)
+        centroid = np.zeros(self.dim, dtype=np.float64)
+        for start in range(0, n, BLOCK_ROWS):
+            centroid += matrix[start:start + BLOCK_ROWS].sum(axis=0)
+        centroid = (centroid / max(np.linalg.norm(centroid), 1e-12)).astype(np.float32)
+        for start in range(0, n, BLOCK_ROWS):
+            relevance[start:start + BLOCK_ROWS] = matrix[start:start + BLOCK_ROWS] @ centroid
+
+        # Cosine distance to the closest chosen chunk, 1 until something is chosen
+        min_distance = np.ones(n, dtype=np.float32)
+        relevance_weight = max(1 - self.diversity, TIE_BREAK)
+        selected = np.zeros(n, dtype=bool)
+        count = 0
+        while count < k:
+            score = relevance_weight * relevance + self.diversity * min_distance
+            score[selected] = -np.inf
+            batch_size = min(self.batch_size, k - count)
+            pool_size = min(n - count, POOL_FACTOR * batch_size)
+            if pool_size < n:
+                candidates = np.argpartition(-score, pool_size)[:pool_size + 1]
+                candidates = candidates[np.argsort(-score[candidates], kind='stable')]
+                pool, bound = np.sort(candidates[:pool_size]), score[candidates[pool_size]]
+            else:
+                pool, bound = np.arange(n), -np.inf
+            pool_vectors = np.asarray(matrix[pool])
+            pool_relevance = relevance[pool]
+            pool_distance = min_distance[pool].copy()
+            taken = np.zeros(pool_size, dtype=bool)
+
+            # Greedy within the pool, updating the pool's distances after every pick
+            batch = []
+            for _ in range(batch_size):
+                pool_score = relevance_weight * pool_relevance + self.diversity * pool_distance
+                pool_score[taken] = -np.inf
+                j = int(np.argmax(pool_score))
+                # A chunk outside the pool may now score higher, only a new scan can tell
+                if batch and pool_score[j] < bound:
+                    break
+                taken[j] = True
+                batch.append(pool[j])
+                pool_distance = np.minimum(pool_distance, 1 - pool_vectors @ pool_vectors[j])
+
+            centers = np.asarray(matrix[np.array(batch)])
+            for start in range(0, n, BLOCK_ROWS):
+                similarity = matrix[start:start + BLOCK_ROWS] @ centers.T
+                min_distance[start:start + BLOCK_ROWS] = np.minimum(min_distance[start:start + BLOCK_ROWS], 1 - similarity.max(axis=1))
+            selected[batch] = True
+            count += len(batch)
+
+        self.stats = {
+            'chunks': int(n),
+            'selected': int(count),
+            'mean_distance_to_selected': float(min_distance.mean()) if n else 0.0,
+            'max_distance_to_selected': float(min_distance.max()) if n else 0.0,
+        }
+        return np.flatnonzero(selected)
+
+    def fit(self, texts):
+        """Embeds texts, chooses target of them, and returns their indices in the order given."""
+        with tempfile.TemporaryDirectory(dir=self.work_dir) as tmp_dir:
+            matrix, keys = self.embed(texts, os.path.join(tmp_dir, 'embeddings.f32'))
+            indices = self.select_indices(matrix)
+            del matrix
+        self.selected_keys = set(keys[indices].tolist())
+        print(f"Selected {self.stats['selected']} of {self.stats['chunks']} chunk(s), "
+              f"mean distance to a selected chunk {self.stats['mean_distance_to_selected']:.3f}")
+        return indices
+
+    def select(self, docs):
+        """Returns the chosen chunks of an in-memory list, in their original order."""
+        return [docs[i] for i in self.fit(doc.page_content for doc in docs)]
+
+    def filter(self, chunks):
+        """Yields, in order, the chunks of a second pass over the stream that fit() chose."""
+        remaining = set(self.selected_keys)
+        for chunk in chunks:
+            key = text_key(chunk.page_content)
+            if key in remaining:
+                remaining.discard(key)
+                yield chunk
+
+    def save_report(self, path):
+        with open(path, 'w') as f:
+            json.dump(dict(self.stats, dim=self.dim, diversity=self.diversity), f, indent=2)
+
+def get_selector():
+    target = config.config['DATAGEN'].get('SELECT_TARGET', 0)
+    if not target:
+        return None
+    return ChunkSelector(target,
+                         dim=config.config['DATAGEN'].get('SELECT_DIM', DEFAULT_DIM),
+                         diversity=config.config['DATAGEN'].get('SELECT_DIVERSITY', DEFAULT_DIVERSITY),
+                         batch_size=config.config['DATAGEN'].get('SELECT_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+                         work_dir=config.config['DATAGEN'].get('SELECT_WORK_DIR') or None)
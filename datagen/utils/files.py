@@ -1,70 +1,229 @@
 import os
 import bz2
-import requests
+import json
+import shutil
+import hashlib
 import zipfile
 import tarfile
-import datetime
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Future, ThreadPoolExecutor
 
-def process_paths(path_array):
-    result_paths = []
+import config
+from client.telemetry import telemetry
 
-    def download_and_extract_http_file(http_url, target_dir):
-        local_filename = http_url.split('/')[-1]
-        local_path = os.path.join(target_dir, local_filename)
-        
-        # Download the file from the HTTP URL
-        with requests.get(http_url, stream=True) as r:
-            r.raise_for_status()
-            with open(local_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_DOWNLOAD_DIR = './data_downloads'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+WRITE_BUFFER_SIZE = 8 * 1024 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = (10, 300)
+LOCAL_ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz')
+
+# Keeps tar members from being written outside the target directory, where the Python version supports it
+TAR_EXTRACT_KWARGS = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+
+def get_download_workers():
+    return config.config['DATAGEN'].get('DOWNLOAD_WORKERS', DEFAULT_DOWNLOAD_WORKERS)
+
+def get_download_dir():
+    return config.config['DATAGEN'].get('DOWNLOAD_DIR', DEFAULT_DOWNLOAD_DIR)
+
+def is_url(path):
+    return path.startswith('http://') or path.startswith('https://')
 
-        # Decompress if necessary and remove the compressed file
-        if zipfile.is_zipfile(local_path):
-            with zipfile.ZipFile(local_path, 'r') as zip_ref:
+def is_local_archive(path):
+    return path.endswith(LOCAL_ARCHIVE_SUFFIXES)
+
+def url_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+
+def extract_archive(archive_path, target_dir):
+    """Extracts a zip, tar or bz2 file into target_dir and returns True, or False if it is none of those."""
+    with telemetry.span('extract'):
+        if zipfile.is_zipfile(archive_path):
+            with zipfile.ZipFile(archive_path, 'r') as zip_ref:
                 zip_ref.extractall(target_dir)
+        elif tarfile.is_tarfile(archive_path):
+            with tarfile.open(archive_path, 'r:*') as tar_ref:
+                tar_ref.extractall(target_dir, **TAR_EXTRACT_KWARGS)
+        elif archive_path.endswith('.bz2'):
+            output_path = os.path.join(target_dir, os.path.basename(archive_path)[:-4])
+            with bz2.BZ2File(archive_path, 'rb') as file, open(output_path, 'wb', buffering=WRITE_BUFFER_SIZE) as new_file:
+                shutil.copyfileobj(file, new_file, DOWNLOAD_CHUNK_SIZE)
+        else:
+            return False
+    return True
+
+class SourceFetcher(object):
+    """Downloads and extracts sources on a thread pool, sharing one pooled HTTP session.
+
+    Each URL gets a stable directory under download_dir, named after a hash of the URL. Interrupted
+    downloads resume from their .part file with a range request, and finished ones are reused as
+    long as the server still reports the same ETag or length. Content is hashed as it is written,
+    and the files of a download whose content was already yielded for an earlier URL are skipped.
+    A URL listed more than once is only fetched once.
+    """
+
+    def __init__(self, executor, max_workers, download_dir=DEFAULT_DOWNLOAD_DIR):
+        self.executor = executor
+        self.download_dir = download_dir
+        self.content_hashes = {}
+        # In-flight and finished fetches by URL key, so a repeated URL never writes the same files twice at once
+        self.url_futures = {}
+        self.walked = set()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def submit(self, path):
+        """Returns a Future of (local path, content hash) for remote sources and archives, and path itself otherwise."""
+        if is_url(path):
+            key = url_key(path)
+            if key not in self.url_futures:
+                self.url_futures[key] = self.executor.submit(self.fetch_url, path)
+            return self.url_futures[key]
+        if os.path.isfile(path) and is_local_archive(path):
+            return self.executor.submit(self.extract_local, path)
+        return path
+
+    def walk(self, item):
+        """Yields the files of a submitted item, waiting on it if it is still being fetched."""
+        if isinstance(item, Future):
+            if item in self.walked:
+                print(f"Skipping {item.result()[0]}, already listed")
+                return
+            self.walked.add(item)
+            item, content_hash = item.result()
+            # Checked here rather than in the workers, so the same copy is kept whatever finishes first
+            if content_hash is not None:
+                first_source = self.content_hashes.setdefault(content_hash, item)
+                if first_source != item:
+                    print(f"Skipping {item}, same content as {first_source}")
+                    return
+        if os.path.isfile(item):
+            yield item
+        elif os.path.isdir(item):
+            # Archives of a directory are all submitted before walking it, so they extract in parallel
+            with os.scandir(item) as entries:
+                names = sorted(entry.name for entry in entries)
+            # A directory left by extracting a sibling archive on an earlier run is extracted again instead
+            extracted = {os.path.splitext(name)[0] for name in names if is_local_archive(name)}
+            paths = [os.path.join(item, name) for name in names
+                     if not (name in extracted and os.path.isdir(os.path.join(item, name)))]
+            for entry in [self.submit(path) for path in paths]:
+                yield from self.walk(entry)
+        else:
+            print(f"Path {item} is not supported")
+
+    def extract_local(self, path):
+        target_dir = os.path.splitext(path)[0]
+        os.makedirs(target_dir, exist_ok=True)
+        extract_archive(path, target_dir)
+        return target_dir, None
+
+    def head(self, url):
+        try:
+            r = self.session.head(url, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+            r.raise_for_status()
+            return r.headers
+        except requests.RequestException:
+            return None
+
+    def fetch_url(self, url):
+        key = url_key(url)
+        target_dir = os.path.join(self.download_dir, key)
+        marker_path = target_dir + '.json'
+        os.makedirs(self.download_dir, exist_ok=True)
+
+        if os.path.exists(marker_path) and os.path.isdir(target_dir):
+            with open(marker_path) as f:
+                marker = json.load(f)
+            headers = self.head(url)
+            validators = (marker['etag'], marker['content_length'])
+            if headers is not None and any(validators) and (headers.get('ETag'), headers.get('Content-Length')) == validators:
+                print(f"Reusing download of {url}")
+                return target_dir, marker['sha256']
+            os.remove(marker_path)
+
+        local_filename = url.split('?')[0].rstrip('/').split('/')[-1] or 'download'
+        part_path, content_hash, headers = self.download(url, os.path.join(self.download_dir, key))
+
+        # The previous content of the directory is dropped, the server reported a different file
+        shutil.rmtree(target_dir, ignore_errors=True)
+        os.makedirs(target_dir)
+        local_path = os.path.join(target_dir, local_filename)
+        os.replace(part_path, local_path)
+        # Compared with the Content-Length of a later HEAD, which a resumed 206 response does not give
+        content_length = str(os.path.getsize(local_path))
+        if extract_archive(local_path, target_dir):
             os.remove(local_path)
-        elif tarfile.is_tarfile(local_path):
-            with tarfile.open(local_path, 'r:*') as tar_ref:
-                tar_ref.extractall(target_dir)
-            os.remove(local_path)
-        elif local_filename.endswith('.bz2'):
-            with bz2.BZ2File(local_path, 'rb') as file:
-                with open(local_path[:-4], 'wb') as new_file:
-                    for data in iter(lambda: file.read(100 * 1024), b''):
-                        new_file.write(data)
-            os.remove(local_path)
 
-    def process_path(path):
-        if os.path.isfile(path):
-            if path.endswith('.zip') or path.endswith('.tar') or path.endswith('.tar.gz') or path.endswith('.tgz'):
-                target_dir = os.path.splitext(path)[0]
-                os.makedirs(target_dir, exist_ok=True)
-                if path.endswith('.zip'):
-                    with zipfile.ZipFile(path, 'r') as zip_ref:
-                        zip_ref.extractall(target_dir)
-                else:
-                    with tarfile.open(path, 'r:*') as tar_ref:
-                        tar_ref.extractall(target_dir)
-                result_paths.extend(process_paths(target_dir))
+        with open(marker_path, 'w') as f:
+            json.dump({'url': url, 'sha256': content_hash, 'etag': headers.get('ETag'),
+                       'content_length': content_length}, f)
+        return target_dir, content_hash
+
+    def download(self, url, base_path):
+        """Streams url into base_path.part, resuming a previous partial download when the server allows it.
+
+        Returns the .part path, the SHA-256 of its content and the response headers.
+        """
+        part_path = base_path + '.part'
+        etag_path = base_path + '.etag'
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {}
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+            # With If-Range the server sends the whole file again if it changed since the partial download
+            if os.path.exists(etag_path):
+                with open(etag_path) as f:
+                    headers['If-Range'] = f.read()
+
+        digest = hashlib.sha256()
+        with telemetry.span('download'), self.session.get(url, stream=True, headers=headers, timeout=REQUEST_TIMEOUT) as r:
+            if r.status_code == 416:
+                # The partial file is already as long as the content, or longer, so it is started over
+                os.remove(part_path)
+                return self.download(url, base_path)
+            r.raise_for_status()
+            if r.headers.get('ETag'):
+                with open(etag_path, 'w') as f:
+                    f.write(r.headers['ETag'])
+            if r.status_code == 206:
+                print(f"Resuming {url} at byte {offset}")
+                with open(part_path, 'rb') as f:
+                    for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                        digest.update(block)
+                mode = 'ab'
             else:
-                result_paths.append(path)
-        elif os.path.isdir(path):
-            for file in os.listdir(path):
-                file_path = os.path.join(path, file)
-                result_paths.extend(process_path(file_path))
-        elif path.startswith('http://') or path.startswith('https://'):
-            target_dir = "./data_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            os.makedirs(target_dir, exist_ok=True)
-            download_and_extract_http_file(path, target_dir)
-            result_paths.extend(process_paths(target_dir))
-        else:
-            print(f"Path {path} is not supported")
+                mode = 'wb'
+            with open(part_path, mode, buffering=WRITE_BUFFER_SIZE) as f:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+            response_headers = r.headers
 
-    for path in path_array:
-        process_path(path)
+        if os.path.exists(etag_path):
+            os.remove(etag_path)
+        return part_path, digest.hexdigest(), response_headers
+
+def iter_paths(path_array, max_workers=None, download_dir=None):
+    """Yields the local files of path_array as they become ready, in a deterministic order.
 
-    return result_paths
+    URLs and archives are all fetched and extracted on a pool of max_workers threads as soon as they
+    are seen, while the files of earlier sources are already being yielded, so loading can start
+    before every download is done.
+    """
+    max_workers = max_workers or get_download_workers()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetcher = SourceFetcher(executor, max_workers, download_dir or get_download_dir())
+        for item in [fetcher.submit(path) for path in path_array]:
+            yield from fetcher.walk(item)
+
+def process_paths(path_array):
+    return list(iter_paths(path_array))
 
 def classify_files(path_array):
     text_files = []
@@ -0,0 +1,61 @@
+import os
+import json
+import hashlib
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {'files': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(path, manifest):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def scan_files(path_list, previous_files):
+    """Fingerprints path_list against the files of a previous manifest.
+
+    Files whose size and mtime are unchanged are trusted without being read, the rest are hashed.
+    Returns the new file entries, the paths that are new or whose content changed, and the paths
+    that are no longer in the corpus.
+    """
+    files = {}
+    changed = set()
+
+    for path in path_list:
+        stat = os.stat(path)
+        previous = previous_files.get(path)
+        if previous is not None and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+            files[path] = previous
+            continue
+
+        content_hash = file_hash(path)
+        if previous is not None and previous['hash'] == content_hash:
+            files[path] = dict(previous, size=stat.st_size, mtime=stat.st_mtime)
+            continue
+
+        files[path] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'hash': content_hash,
+            'chunks': [],
+        }
+        changed.add(path)
+
+    deleted = set(previous_files) - set(files)
+
+    return files, changed, deleted
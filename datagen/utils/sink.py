@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import hashlib
+
+from datagen.utils.manifest import file_hash
+
+# pyarrow and datasets are only imported when a dataset is written or read, they are slow to import
+PARQUET_COMPRESSION = 'zstd'
+DEFAULT_READ_BATCH_SIZE = 256
+JSON_SUFFIXES = ('.jsonl', '.json')
+EXPORT_FORMATS = ('jsonl', 'csv')
+PART_NAME = 'part-{:05d}.parquet'
+PART_PATTERN = re.compile(r'part-(\d+)\.parquet(\.tmp)?')
+DATASET_COLUMNS = [
+    ('chunk_id', 'int64'),
+    ('chunk_hash', 'string'),
+    ('question', 'string'),
+    ('context', 'string'),
+    ('ground_truth', 'string'),
+    ('file_path', 'string'),
+]
+
+def dataset_schema():
+    import pyarrow as pa
+
+    return pa.schema([(name, pa.type_for_alias(alias)) for name, alias in DATASET_COLUMNS])
+
+class ParquetSink(object):
+    """Append-only Parquet dataset writer with a checkpoint of the last chunk whose rows were written.
+
+    The dataset is a directory of part files, one per append, each written to a temporary file and
+    renamed into place. The checkpoint also records how many parts there were after that chunk, so
+    parts written after the last checkpoint (e.g. by a run that crashed mid-write) are deleted on
+    reopen. Without a checkpoint the dataset is started afresh.
+    """
+
+    def __init__(self, path, schema=None):
+        self.path = path
+        self.checkpoint_path = path + '.checkpoint'
+        self.schema = schema if schema is not None else dataset_schema()
+        self.last_chunk_id = -1
+        self.parts = 0
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            self.last_chunk_id = checkpoint['last_chunk_id']
+            self.parts = checkpoint['parts']
+
+        for name in os.listdir(path):
+            match = PART_PATTERN.fullmatch(name)
+            if match and (match.group(2) or int(match.group(1)) >= self.parts):
+                os.remove(os.path.join(path, name))
+
+    def append(self, rows, last_chunk_id):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if rows:
+            part_path = os.path.join(self.path, PART_NAME.format(self.parts))
+            tmp_path = part_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pq.write_table(pa.Table.from_pylist(rows, schema=self.schema), f, compression=PARQUET_COMPRESSION)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, part_path)
+            self.parts += 1
+        self.last_chunk_id = last_chunk_id
+        self._write_checkpoint()
+
+    def _write_checkpoint(self):
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_chunk_id': self.last_chunk_id, 'parts': self.parts}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def is_json(path):
+    return path.endswith(JSON_SUFFIXES)
+
+def parquet_files(path):
+    """Returns the part files of a dataset directory in order, or path itself if it is a single file."""
+    if not os.path.isdir(path):
+        return [path]
+    parts = []
+    for name in os.listdir(path):
+        match = PART_PATTERN.fullmatch(name)
+        if match and not match.group(2):
+            parts.append((int(match.group(1)), os.path.join(path, name)))
+    return [part_path for _, part_path in sorted(parts)]
+
+def iter_jsonl(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def iter_batches(path, columns=None, batch_size=DEFAULT_READ_BATCH_SIZE):
+    """Yields Arrow record batches of a Parquet dataset, reading only columns, from memory-mapped files."""
+    import pyarrow.parquet as pq
+
+    for part_path in parquet_files(path):
+        yield from pq.ParquetFile(part_path, memory_map=True).iter_batches(batch_size=batch_size, columns=columns)
+
+def iter_rows(path, columns=None, batch_size=DEFAULT_READ_BATCH_SIZE):
+    """Yields the rows of a Parquet dataset, or of a JSON Lines file from before Parquet, as dicts."""
+    if is_json(path):
+        yield from iter_jsonl(path)
+        return
+    for batch in iter_batches(path, columns, batch_size):
+        yield from batch.to_pylist()
+
+def count_rows(path):
+    import pyarrow.parquet as pq
+
+    if is_json(path):
+        return sum(1 for _ in iter_jsonl(path))
+    return sum(pq.ParquetFile(part_path).metadata.num_rows for part_path in parquet_files(path))
+
+def dataset_hash(path):
+    """Returns a content hash of a dataset, the file hash itself for a single file."""
+    if not os.path.isdir(path):
+        return file_hash(path)
+    digest = hashlib.sha256()
+    for part_path in parquet_files(path):
+        digest.update(file_hash(part_path).encode('utf-8'))
+    return digest.hexdigest()
+
+def open_dataset(path):
+    """Returns the dataset at path as a memory-mapped, Arrow-backed datasets.Dataset."""
+    from datasets import Dataset
+
+    if is_json(path):
+        return Dataset.from_json(path)
+    return Dataset.from_parquet(parquet_files(path))
+
+def export_path_for(path, export_format):
+    return f"{os.path.splitext(path.rstrip(os.sep))[0]}.{export_format}"
+
+def export_dataset(path, export_format):
+    """Writes the Parquet dataset at path next to it as CSV or JSON Lines, a batch at a time, and returns the export's path."""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    export_path = export_path_for(path, export_format)
+
+    if export_format == 'csv':
+        import pyarrow.csv as pacsv
+        import pyarrow.parquet as pq
+
+        part_paths = parquet_files(path)
+        schema = pq.ParquetFile(part_paths[0]).schema_arrow if part_paths else dataset_schema()
+        with pacsv.CSVWriter(export_path, schema) as writer:
+            for batch in iter_batches(path):
+                writer.write_batch(batch)
+    else:
+        with open(export_path, 'w') as f:
+            for row in iter_rows(path):
+                f.write(json.dumps(row) + '\n')
+    return export_path
@@ -0,0 +1,294 @@
+"""Result analytics: per-metric score distributions and a run-to-run regression report.
+
+    python -m eval.analytics <results.parquet> [...] [--baseline <results.parquet> ...] [--slice-by file_path] [--output report.json]
+
+The result files of a run, e.g. those of several shards, are concatenated into one Arrow table and
+its scores into a rows × metrics matrix, so every statistic is a vectorized numpy or Arrow
+operation rather than a loop over rows. With a baseline run, rows of both runs with the same
+row_key, a hash of their question and context, are paired and the per-metric score deltas are
+reported, overall and per slice of a metadata column such as file_path. Only the keys, scores and
+slice columns are read, the long text columns are left on disk.
+"""
+import json
+import argparse
+import warnings
+
+import numpy as np
+
+from .metrics import LOWER_IS_BETTER, metric_threshold
+from .results import SCORE_SUFFIX, metric_names, read_results, result_columns, row_key
+
+PERCENTILES = (5, 25, 50, 75, 95)
+HISTOGRAM_BINS = 10
+DEFAULT_TOLERANCE = 0.02
+DEFAULT_TOP_SLICES = 10
+# Two-sided 95% normal quantile, for the confidence interval of a mean delta
+Z_95 = 1.959963984540054
+KEY_BATCH_SIZE = 65536
+
+def load_results(paths: list, slice_by: list = ()):
+    """Returns the result files at paths as one Arrow table, with only the columns the report reads.
+
+    Reasons, outputs and ids are left out, and files scored on different metrics are padded with nulls.
+    """
+    import pyarrow as pa
+
+    tables = []
+    for path in paths:
+        names = result_columns(path)
+        missing = [column for column in slice_by if column not in names]
+        if missing:
+            raise ValueError(f"{path} has no {', '.join(missing)} column(s) to slice by")
+        table = read_results(path, ['row_key'] * ('row_key' in names) + [name for name in names
+                                                                         if name in slice_by or name.endswith(SCORE_SUFFIX)])
+        if 'row_key' not in names:
+            table = table.append_column('row_key', pa.array(legacy_row_keys(path), type=pa.uint64()))
+        tables.append(table)
+    if len(tables) == 1:
+        return tables[0]
+    return pa.concat_tables(tables, promote_options='default')
+
+def legacy_row_keys(path: str) -> list:
+    """Returns the row keys of results written before they had one, from their question and context."""
+    keys = []
+    for batch in read_results(path, ['question', 'context']).to_batches(max_chunksize=KEY_BATCH_SIZE):
+        keys.extend(row_key(question, context) for question, context in zip(batch['question'].to_pylist(), batch['context'].to_pylist()))
+    return keys
+
+def score_matrix(table, names: list = None):
+    """Returns the metric names and a rows × metrics matrix of their scores, NaN where a row has none."""
+    names = metric_names(table) if names is None else names
+    matrix = np.full((table.num_rows, len(names)), np.nan)
+    for j, name in enumerate(names):
+        if name + SCORE_SUFFIX in table.column_names:
+            matrix[:, j] = table[name + SCORE_SUFFIX].to_numpy()
+    return names, matrix
+
+def passes(names: list, matrix: np.ndarray) -> np.ndarray:
+    """Returns a boolean matrix of the scores that pass their metric's threshold, False where there is no score."""
+    thresholds = np.array([metric_threshold(name) for name in names])
+    lower_is_better = np.array([name in LOWER_IS_BETTER for name in names])
+    with np.errstate(invalid='ignore'):
+        return np.where(lower_is_better, matrix <= thresholds, matrix >= thresholds)
+
+def slice_codes(table, column: str):
+    """Returns the integer code of each row's value of column and the value of each code."""
+    import pyarrow.compute as pc
+
+    encoded = pc.fill_null(table[column].cast('string'), '').combine_chunks().dictionary_encode()
+    return encoded.indices.to_numpy(), encoded.dictionary.to_pylist()
+
+def group_means(codes: np.ndarray, groups: int, matrix: np.ndarray):
+    """Returns the per-group mean of each column of matrix, ignoring NaNs, and the per-group counts."""
+    valid = ~np.isnan(matrix)
+    values = np.where(valid, matrix, 0.0)
+    sums = np.stack([np.bincount(codes, weights=values[:, j], minlength=groups) for j in range(matrix.shape[1])], axis=1)
+    counts = np.stack([np.bincount(codes, weights=valid[:, j], minlength=groups) for j in range(matrix.shape[1])], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts, counts
+
+def as_float(value):
+    """Returns value as a float for the report, None instead of NaN."""
+    return None if np.isnan(value) else float(value)
+
+def distributions(names: list, matrix: np.ndarray) -> dict:
+    """Returns the count, mean, spread, percentiles, histogram and pass rate of every metric."""
+    valid = ~np.isnan(matrix)
+    counts = valid.sum(axis=0)
+    passed = passes(names, matrix).sum(axis=0)
+    # Metrics no row was scored on give all-NaN columns, whose warnings are expected
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        means = np.nanmean(matrix, axis=0)
+        stds = np.nanstd(matrix, axis=0)
+        mins = np.nanmin(matrix, axis=0) if len(matrix) else np.full(len(names), np.nan)
+        maxs = np.nanmax(matrix, axis=0) if len(matrix) else np.full(len(names), np.nan)
+        percentiles = np.nanpercentile(matrix, PERCENTILES, axis=0) if len(matrix) else np.full((len(PERCENTILES), len(names)), np.nan)
+
+    report = {}
+    for j, name in enumerate(names):
+        histogram, _ = np.histogram(matrix[valid[:, j], j], bins=HISTOGRAM_BINS, range=(0.0, 1.0))
+        report[name] = {
+            'rows': int(counts[j]),
+            'mean': as_float(means[j]),
+            'std': as_float(stds[j]),
+            'min': as_float(mins[j]),
+            'max': as_float(maxs[j]),
+            'percentiles': {f"p{p}": as_float(percentiles[i, j]) for i, p in enumerate(PERCENTILES)},
+            'histogram': histogram.tolist(),
+            'threshold': metric_threshold(name),
+            'pass_rate': float(passed[j] / counts[j]) if counts[j] else None,
+        }
+    return report
+
+def slice_report(table, names: list, matrix: np.ndarray, column: str) -> dict:
+    """Returns the rows, mean and pass rate of every metric for each value of column."""
+    codes, labels = slice_codes(table, column)
+    means, counts = group_means(codes, len(labels), matrix)
+    pass_rates, _ = group_means(codes, len(labels), np.where(np.isnan(matrix), np.nan, passes(names, matrix)))
+    rows = np.bincount(codes, minlength=len(labels))
+    return {
+        label: {
+            'rows': int(rows[g]),
+            'metrics': {name: {'mean': as_float(means[g, j]), 'pass_rate': as_float(pass_rates[g, j])}
+                        for j, name in enumerate(names) if counts[g, j]},
+        }
+        for g, label in enumerate(labels)
+    }
+
+def pair_rows(baseline, candidate):
+    """Returns the indices of the rows of both runs with the same row_key, in candidate order.
+
+    A question and context repeated within a run is paired through its first row.
+    """
+    baseline_keys, baseline_first = np.unique(baseline['row_key'].to_numpy(), return_index=True)
+    candidate_keys, candidate_first = np.unique(candidate['row_key'].to_numpy(), return_index=True)
+    _, baseline_matches, candidate_matches = np.intersect1d(baseline_keys, candidate_keys, assume_unique=True, return_indices=True)
+    baseline_rows = baseline_first[baseline_matches]
+    candidate_rows = candidate_first[candidate_matches]
+    order = np.argsort(candidate_rows, kind='stable')
+    return baseline_rows[order], candidate_rows[order]
+
+def paired_deltas(names: list, baseline_scores: np.ndarray, candidate_scores: np.ndarray, tolerance: float = DEFAULT_TOLERANCE) -> dict:
+    """Returns, for every metric, how the paired scores moved from the baseline run to the candidate run.
+
+    A metric regressed when its mean change, signed so that positive is better, is worse than
+    -tolerance and the upper bound of its 95% confidence interval is below zero.
+    """
+    direction = np.array([-1.0 if name in LOWER_IS_BETTER else 1.0 for name in names])
+    delta = candidate_scores - baseline_scores
+    improvement = delta * direction
+    valid = ~np.isnan(delta)
+    counts = valid.sum(axis=0)
+    baseline_passed = passes(names, baseline_scores) & valid
+    candidate_passed = passes(names, candidate_scores) & valid
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean_delta = np.nanmean(delta, axis=0)
+        mean_improvement = np.nanmean(improvement, axis=0)
+        half_width = Z_95 * np.nanstd(delta, axis=0, ddof=1) / np.sqrt(counts)
+
+    report = {}
+    for j, name in enumerate(names):
+        regressed = bool(counts[j] > 1 and mean_improvement[j] < -tolerance and mean_improvement[j] + half_width[j] < 0)
+        report[name] = {
+            'pairs': int(counts[j]),
+            'baseline_mean': as_float(np.nanmean(baseline_scores[valid[:, j], j])) if counts[j] else None,
+            'candidate_mean': as_float(np.nanmean(candidate_scores[valid[:, j], j])) if counts[j] else None,
+            'mean_delta': as_float(mean_delta[j]),
+            'ci_low': as_float(mean_delta[j] - half_width[j]),
+            'ci_high': as_float(mean_delta[j] + half_width[j]),
+            'worse_rows': int((improvement[:, j] < -tolerance).sum()),
+            'better_rows': int((improvement[:, j] > tolerance).sum()),
+            'newly_failing': int((baseline_passed[:, j] & ~candidate_passed[:, j]).sum()),
+            'newly_passing': int((~baseline_passed[:, j] & candidate_passed[:, j]).sum()),
+            'regressed': regressed,
+        }
+    return report
+
+def paired_slice_report(table, candidate_rows: np.ndarray, names: list, baseline_scores: np.ndarray,
+                        candidate_scores: np.ndarray, column: str) -> dict:
+    """Returns the pairs, mean delta and newly failing rows of every metric for each value of column."""
+    codes, labels = slice_codes(table, column)
+    codes = codes[candidate_rows]
+    means, counts = group_means(codes, len(labels), candidate_scores - baseline_scores)
+    newly_failing = passes(names, baseline_scores) & ~passes(names, candidate_scores) & ~np.isnan(candidate_scores)
+    failing = np.stack([np.bincount(codes, weights=newly_failing[:, j], minlength=len(labels)) for j in range(len(names))], axis=1)
+    pairs = np.bincount(codes, minlength=len(labels))
+    return {
+        label: {
+            'pairs': int(pairs[g]),
+            'metrics': {name: {'mean_delta': as_float(means[g, j]), 'newly_failing': int(failing[g, j])}
+                        for j, name in enumerate(names) if counts[g, j]},
+        }
+        for g, label in enumerate(labels) if pairs[g]
+    }
+
+def build_report(paths: list, baseline_paths: list = None, slice_by: list = (), tolerance: float = DEFAULT_TOLERANCE) -> dict:
+    """Returns the analytics report of the run in paths, compared with the run in baseline_paths if given."""
+    table = load_results(paths, slice_by)
+    names, matrix = score_matrix(table)
+    report = {
+        'results': list(paths),
+        'rows': table.num_rows,
+        'metrics': distributions(names, matrix),
+        'slices': {column: slice_report(table, names, matrix, column) for column in slice_by},
+    }
+    if not baseline_paths:
+        return report
+
+    baseline = load_results(baseline_paths)
+    names = [name for name in names if name in metric_names(baseline)]
+    _, baseline_matrix = score_matrix(baseline, names)
+    _, candidate_matrix = score_matrix(table, names)
+    baseline_rows, candidate_rows = pair_rows(baseline, table)
+    baseline_scores = baseline_matrix[baseline_rows]
+    candidate_scores = candidate_matrix[candidate_rows]
+    deltas = paired_deltas(names, baseline_scores, candidate_scores, tolerance)
+    report['baseline'] = {
+        'results': list(baseline_paths),
+        'rows': baseline.num_rows,
+        'pairs': len(candidate_rows),
+        'tolerance': tolerance,
+        'metrics': deltas,
+        'regressed': [name for name, delta in deltas.items() if delta['regressed']],
+        'slices': {column: paired_slice_report(table, candidate_rows, names, baseline_scores, candidate_scores, column)
+                   for column in slice_by},
+    }
+    return report
+
+def format_value(value, spec='.3f'):
+    return '-' if value is None else format(value, spec)
+
+def print_report(report: dict, top_slices: int = DEFAULT_TOP_SLICES):
+    print(f"{report['rows']} row(s) from {', '.join(report['results'])}")
+    print(f"{'metric':<24}{'rows':>8}{'mean':>8}{'p5':>8}{'p50':>8}{'p95':>8}{'pass':>8}")
+    for name, stats in report['metrics'].items():
+        print(f"{name:<24}{stats['rows']:>8}{format_value(stats['mean']):>8}{format_value(stats['percentiles']['p5']):>8}"
+              f"{format_value(stats['percentiles']['p50']):>8}{format_value(stats['percentiles']['p95']):>8}"
+              f"{format_value(stats['pass_rate'], '.1%'):>8}")
+
+    comparison = report.get('baseline')
+    if comparison is None:
+        return
+    print(f"\n{comparison['pairs']} row(s) paired with {comparison['rows']} baseline row(s)")
+    print(f"{'metric':<24}{'pairs':>8}{'delta':>8}{'95% CI':>18}{'newly failing':>15}")
+    for name, delta in comparison['metrics'].items():
+        ci = f"[{format_value(delta['ci_low'], '+.3f')}, {format_value(delta['ci_high'], '+.3f')}]"
+        flag = "  REGRESSED" if delta['regressed'] else ""
+        print(f"{name:<24}{delta['pairs']:>8}{format_value(delta['mean_delta'], '+.3f'):>8}{ci:>18}{delta['newly_failing']:>15}{flag}")
+
+    # A slice can regress while its metric holds up overall, so every metric is broken down
+    for column, slices in comparison['slices'].items():
+        for name in comparison['metrics']:
+            sign = -1.0 if name in LOWER_IS_BETTER else 1.0
+            ranked = sorted((stats['metrics'][name]['mean_delta'] * sign, label, stats) for label, stats in slices.items()
+                            if name in stats['metrics'] and stats['metrics'][name]['mean_delta'] is not None
+                            and stats['metrics'][name]['mean_delta'] * sign < -comparison['tolerance'])
+            if not ranked:
+                continue
+            print(f"\n{name} by {column}, {len(ranked)} slice(s) worse by more than {comparison['tolerance']}:")
+            for _, label, stats in ranked[:top_slices]:
+                print(f"    {format_value(stats['metrics'][name]['mean_delta'], '+.3f')}  "
+                      f"{stats['metrics'][name]['newly_failing']:>5} newly failing of {stats['pairs']:>6}  {label}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('results', nargs='+', help="result files of the run to report on")
+    parser.add_argument('--baseline', nargs='+', help="result files of the run to compare with")
+    parser.add_argument('--slice-by', nargs='*', default=[], help="metadata columns to break the scores down by, e.g. file_path")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="smallest mean score change counted as a regression")
+    parser.add_argument('--top-slices', type=int, default=DEFAULT_TOP_SLICES, help="worst slices listed per metric")
+    parser.add_argument('--output', help="write the full report to this JSON file")
+    args = parser.parse_args()
+
+    report = build_report(args.results, args.baseline, args.slice_by, args.tolerance)
+    print_report(report, args.top_slices)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,17 @@
-import config
 import json
-from datasets import Dataset as ds
+import config
 from datetime import datetime
 
-from eval_tests import base_tests
+from eval.eval_tests import base_tests, get_eval_options
+from eval.results import results_table, write_results
+from datagen.utils.sink import open_dataset
 
-eval_dataset = ds.from_csv('datagen/qac_out/eval_dataset_20240527-211903.csv')
+eval_dataset = open_dataset(config.config['EVAL']['DATASET_PATH'])
 
-gen_provider = config.config['DATAGEN']['GEN_PROVIDER']
-eval_provider = config.config['EVAL']['EVAL_PROVIDER']
-test_list = config.config['EVAL']['EVAL_TESTS']
-test_results = base_tests(
-    gen_provider=gen_provider,
-    eval_provider=eval_provider,
-    dataset=eval_dataset,
-    test_list=test_list,
-    use_answers_from_dataset=False
-)
+test_results = base_tests(eval_dataset=eval_dataset, **get_eval_options())
 print(json.dumps(test_results, indent=2))
 
 current_date = datetime.now().strftime('%Y%m%d_%H%M%S')
-with open(f"datagen/qac_out/eval_results_{current_date}.json", 'w') as f:
-    json.dump(test_results, f)
+paths = write_results(results_table(test_results), f"datagen/qac_out/eval_results_{current_date}.parquet",
+                      config.config['EVAL'].get('EXPORT_FORMATS', []))
+print(f"Results written to {', '.join(paths)}")
@@ -0,0 +1,111 @@
+import re
+import math
+import threading
+from collections import Counter
+
+from client.rate_limiter import estimate_tokens
+from .consistency import ConsistencyTracker
+
+DEFAULT_TOKEN_BUDGET = 0
+DEFAULT_TOLERANCE = 0.1
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Metrics that send the context to the judge, the others only read the input and output
+CONTEXT_METRICS = ["Hallucination", "Faithfulness", "RAGASAnswerRelevancy", "RAGASFaithfulness"]
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n\s*\n')
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+def words(text):
+    return re.findall(r'\w+', text.lower())
+
+def bm25_scores(sentences, query):
+    """Returns the BM25 score of each sentence for the words of query, with the sentences as the corpus."""
+    if not sentences:
+        return []
+    sentence_words = [words(sentence) for sentence in sentences]
+    query = set(query)
+    document_frequency = Counter(word for sentence in sentence_words for word in set(sentence) if word in query)
+    count = len(sentences)
+    average_length = (sum(len(sentence) for sentence in sentence_words) / count) or 1
+    idf = {word: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5)) for word, frequency in document_frequency.items()}
+
+    scores = []
+    for sentence in sentence_words:
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(sentence) / average_length)
+        term_frequency = Counter(word for word in sentence if word in query)
+        scores.append(sum(idf[word] * frequency * (BM25_K1 + 1) / (frequency + norm) for word, frequency in term_frequency.items()))
+    return scores
+
+class ContextCompactor(object):
+    """Trims a test case's context to the sentences relevant to its input and output, within a token budget.
+
+    Sentences are ranked by BM25 against the words of the input and the actual output, and the best
+    ones are kept, in their original order, until token_budget is reached. Sentences sharing no word
+    with either are dropped. Contexts already within the budget are left as they are.
+
+    The first consistency_rows trimmed test cases are also judged on the full context, and the score
+    differences are kept for report().
+    """
+
+    def __init__(self, token_budget, consistency_rows=0, tolerance=DEFAULT_TOLERANCE):
+        self.token_budget = token_budget
+        self.tolerance = tolerance
+        self.consistency = ConsistencyTracker(consistency_rows)
+        self.rows = 0
+        self.compacted_rows = 0
+        self.original_tokens = 0
+        self.kept_tokens = 0
+        self._lock = threading.Lock()
+
+    def compact(self, context, input, actual_output):
+        """Returns the trimmed context, or context itself if it already fits the budget or no sentence was dropped."""
+        original_tokens = estimate_tokens(context)
+        compacted = context
+        sentences = split_sentences(context) if original_tokens > self.token_budget else []
+        # A context with no sentence, e.g. only whitespace, is left as it is
+        if sentences:
+            scores = bm25_scores(sentences, words(input or '') + words(actual_output or ''))
+            kept = []
+            used = 0
+            for i in sorted(range(len(sentences)), key=lambda i: (-scores[i], i)):
+                # Past the relevant sentences, unless none was relevant, in which case the first one is kept
+                if scores[i] <= 0 and kept:
+                    break
+                cost = estimate_tokens(sentences[i])
+                if kept and used + cost > self.token_budget:
+                    continue
+                kept.append(i)
+                used += cost
+            # With every sentence kept the context is left as it is, and not counted as compacted
+            if len(kept) < len(sentences):
+                compacted = ' '.join(sentences[i] for i in sorted(kept))
+
+        with self._lock:
+            self.rows += 1
+            self.original_tokens += original_tokens
+            self.kept_tokens += estimate_tokens(compacted)
+            if compacted is not context:
+                self.compacted_rows += 1
+        return compacted
+
+    def wants_consistency_check(self):
+        return self.consistency.wants_check()
+
+    def record_consistency(self, name, compacted_metric, full_metric):
+        self.consistency.record(name, compacted_metric, full_metric)
+
+    def report(self):
+        consistency = self.consistency.report()
+        for report in consistency.values():
+            report['within_tolerance'] = report['mean_abs_diff'] <= self.tolerance
+        with self._lock:
+            return {
+                'rows': self.rows,
+                'compacted_rows': self.compacted_rows,
+                'original_tokens': self.original_tokens,
+                'kept_tokens': self.kept_tokens,
+                'compression_ratio': self.kept_tokens / self.original_tokens if self.original_tokens else 1.0,
+                'consistency': consistency,
+            }
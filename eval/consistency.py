@@ -0,0 +1,47 @@
+import threading
+
+from .metrics import LOWER_IS_BETTER
+
+def passed(name, metric):
+    if name in LOWER_IS_BETTER:
+        return metric.score <= metric.threshold
+    return metric.score >= metric.threshold
+
+class ConsistencyTracker(object):
+    """Agreement between a shortcut's scores and the full judging of the same metrics.
+
+    The first rows test cases asking for a check are also judged the full way, and for every metric
+    the absolute score differences and whether both agree on passing are kept for report().
+    passed(name, metric) decides whether a metric passed.
+    """
+
+    def __init__(self, rows=0, passed=passed):
+        self.rows = rows
+        self.passed = passed
+        self.differences = {}
+        self.agreements = {}
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def wants_check(self):
+        with self._lock:
+            if self._checked >= self.rows:
+                return False
+            self._checked += 1
+            return True
+
+    def record(self, name, metric, reference_metric):
+        with self._lock:
+            self.differences.setdefault(name, []).append(abs(metric.score - reference_metric.score))
+            self.agreements.setdefault(name, []).append(self.passed(name, metric) == self.passed(name, reference_metric))
+
+    def report(self):
+        with self._lock:
+            return {
+                name: {
+                    'rows': len(differences),
+                    'mean_abs_diff': sum(differences) / len(differences),
+                    'pass_agreement': sum(self.agreements[name]) / len(self.agreements[name]),
+                }
+                for name, differences in self.differences.items()
+            }
@@ -1,41 +1,43 @@
-import os
-from functools import partial
+from functools import lru_cache
 
 from client.llm_client import LLMClient
-from datagen.utils import files
-from datagen.prompt import find_prompt
-from datagen.dataprep import convert_to_text, preprocess
+from client.rate_limiter import estimate_tokens
+from client.telemetry import telemetry
+from datagen.prompt import find_template, get_output_parser
 
-from langchain.prompts import ChatPromptTemplate
-from langchain.output_parsers import ResponseSchema
-from langchain.output_parsers import StructuredOutputParser
+@lru_cache(maxsize=None)
+def get_generation_chain(gen_provider: str):
+    from langchain.prompts import ChatPromptTemplate
 
-def generation(gen_provider: str, input: str, context: str) -> str:
-    question_schema = ResponseSchema(
-        name="answer",
-        description="an answer based on the context."
-    )
-    
-    question_response_schemas = [
-        question_schema,
-    ]
+    gen_llm = LLMClient().get_gen_client(gen_provider)
+
+    bare_prompt_template = "{content}"
+    bare_template = ChatPromptTemplate.from_template(template=bare_prompt_template)
+    answer_generation_chain = bare_template | gen_llm
 
-    question_output_parser = StructuredOutputParser.from_response_schemas(question_response_schemas)
-    format_instructions = question_output_parser.get_format_instructions()
+    return answer_generation_chain
 
-    gen_llm = LLMClient().get_gen_client(gen_provider)
+def generation(gen_provider: str, input: str, context: str) -> str:
+    answer_generation_chain = get_generation_chain(gen_provider)
+
+    # Both come precompiled from the registry, the template is only re-read if the CSV changes
+    answer_output_parser, format_instructions = get_output_parser(
+        ("answer", "an answer based on the context."),
+    )
+    prompt_template = find_template("user", "gen_prompt1")
 
-    input_template = find_prompt("user", "gen_prompt1")
-    prompt_template = ChatPromptTemplate.from_template(template=input_template)
     message = prompt_template.format_messages(
         question=input,
         context=context,
         format_instructions=format_instructions
     )
-
-    bare_prompt_template = "{content}"
-    bare_template = ChatPromptTemplate.from_template(template=bare_prompt_template)
-    answer_generation_chain = bare_template | gen_llm
-    response = answer_generation_chain.invoke({"content": message})
-
-    return response
+    rate_limiter = LLMClient().get_rate_limiter(gen_provider, 'DATAGEN')
+    with telemetry.span('generation'):
+        response = rate_limiter.call(lambda: answer_generation_chain.invoke({"content": message}),
+                                     tokens=estimate_tokens(message))
+    content = getattr(response, 'content', response)
+
+    try:
+        return answer_output_parser.parse(content)["answer"]
+    except Exception:
+        return content
@@ -0,0 +1,35 @@
+import asyncio
+
+from deepeval.models.base_model import DeepEvalBaseLLM
+
+from client.rate_limiter import estimate_tokens
+
+class LLMJudge(DeepEvalBaseLLM):
+    """Lets deepeval metrics use any langchain chat model or LLM returned by LLMClient as judge.
+
+    With a rate_limiter every judge call goes through it, async calls included, which run the
+    limited call on a worker thread.
+    """
+
+    def __init__(self, model, rate_limiter=None):
+        self.model = model
+        self.rate_limiter = rate_limiter
+
+    def load_model(self):
+        return self.model
+
+    def generate(self, prompt: str) -> str:
+        if self.rate_limiter is not None:
+            response = self.rate_limiter.call(lambda: self.model.invoke(prompt), tokens=estimate_tokens(prompt))
+        else:
+            response = self.model.invoke(prompt)
+        return getattr(response, 'content', response)
+
+    async def a_generate(self, prompt: str) -> str:
+        if self.rate_limiter is not None:
+            return await asyncio.to_thread(self.generate, prompt)
+        response = await self.model.ainvoke(prompt)
+        return getattr(response, 'content', response)
+
+    def get_model_name(self):
+        return getattr(self.model, 'model_name', None) or type(self.model).__name__
@@ -0,0 +1,116 @@
+"""Columnar eval results: one row per test case, with a score and a reason column per metric."""
+import os
+import json
+import hashlib
+from typing import TYPE_CHECKING
+
+from datagen.utils.sink import PARQUET_COMPRESSION
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+RESULT_COLUMNS = ['row_index', 'row_key', 'test_id', 'created_at', 'question', 'context', 'file_path', 'actual_output']
+SCORE_SUFFIX = '.score'
+REASON_SUFFIX = '.reason'
+EXPORT_FORMATS = ('json', 'csv')
+EXPORT_BATCH_SIZE = 1024
+
+def row_key(question: str, context: str) -> int:
+    """Returns a 64-bit hash of a row's question and context, which identifies the row across runs."""
+    digest = hashlib.blake2b(f"{question}\x1f{context}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+def results_table(test_results: list) -> 'pa.Table':
+    """Returns the test case dicts of base_tests as an Arrow table, with the row_key of each row."""
+    import pyarrow as pa
+
+    metric_names = []
+    evals = []
+    for test_case_dict in test_results:
+        evals.append({eval_result['test_case']: eval_result for eval_result in test_case_dict['evals']})
+        metric_names.extend(name for name in evals[-1] if name not in metric_names)
+
+    columns = {}
+    for name in RESULT_COLUMNS:
+        if name == 'row_key':
+            columns[name] = pa.array([row_key(test_case_dict['question'], test_case_dict['context']) for test_case_dict in test_results],
+                                     type=pa.uint64())
+        # row_index is only set on the results of a shard, file_path only if the dataset has it
+        elif test_results and name in test_results[0]:
+            columns[name] = pa.array([test_case_dict[name] for test_case_dict in test_results],
+                                     type=pa.int64() if name == 'row_index' else pa.string())
+    for name in metric_names:
+        scores = [row_evals[name]['score'] if name in row_evals else None for row_evals in evals]
+        columns[name + SCORE_SUFFIX] = pa.array([None if score is None else float(score) for score in scores], type=pa.float64())
+        columns[name + REASON_SUFFIX] = pa.array([row_evals[name]['reason'] if name in row_evals else None for row_evals in evals],
+                                                 type=pa.string())
+    return pa.table(columns)
+
+def metric_names(table: 'pa.Table') -> list:
+    return [column[:-len(SCORE_SUFFIX)] for column in table.column_names if column.endswith(SCORE_SUFFIX)]
+
+def iter_records(table: 'pa.Table'):
+    """Yields the rows of a results table as test case dicts, in the format base_tests returns."""
+    names = metric_names(table)
+    for batch in table.to_batches(max_chunksize=EXPORT_BATCH_SIZE):
+        for row in batch.to_pylist():
+            test_case_dict = {column: row[column] for column in RESULT_COLUMNS if column in row and column != 'row_key'}
+            test_case_dict['evals'] = [{'test_case': name, 'score': row[name + SCORE_SUFFIX], 'reason': row[name + REASON_SUFFIX]}
+                                       for name in names]
+            yield test_case_dict
+
+def metric_means(table: 'pa.Table') -> dict:
+    import pyarrow.compute as pc
+
+    means = {name: pc.mean(table[name + SCORE_SUFFIX]).as_py() for name in metric_names(table)}
+    return {name: mean for name, mean in means.items() if mean is not None}
+
+def read_results(path: str, columns: list = None) -> 'pa.Table':
+    """Returns the results at path as an Arrow table, memory-mapped for Parquet, with only columns if given."""
+    import pyarrow.parquet as pq
+
+    if path.endswith('.json'):
+        with open(path) as f:
+            table = results_table(json.load(f))
+        return table if columns is None else table.select(columns)
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+def result_columns(path: str) -> list:
+    import pyarrow.parquet as pq
+
+    if path.endswith('.json'):
+        return read_results(path).column_names
+    return pq.read_schema(path).names
+
+def export_results(table: 'pa.Table', path: str, export_format: str) -> str:
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    export_path = f"{os.path.splitext(path)[0]}.{export_format}"
+
+    if export_format == 'csv':
+        import pyarrow.csv as pacsv
+
+        pacsv.write_csv(table, export_path)
+    else:
+        # The same list of test case dicts the results used to be dumped as, written a row at a time
+        with open(export_path, 'w') as f:
+            f.write('[')
+            for i, test_case_dict in enumerate(iter_records(table)):
+                f.write((', ' if i else '') + json.dumps(test_case_dict))
+            f.write(']')
+    return export_path
+
+def write_results(table: 'pa.Table', path: str, export_formats: list = ()) -> list:
+    """Writes a results table to path as Parquet, then next to it in each of export_formats.
+
+    Returns the paths written. The Parquet file is written to a temporary file first, so a crashed
+    run never leaves a truncated one behind.
+    """
+    import pyarrow.parquet as pq
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, compression=PARQUET_COMPRESSION)
+    os.replace(tmp_path, path)
+    return [path] + [export_results(table, path, export_format) for export_format in export_formats]
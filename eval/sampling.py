@@ -0,0 +1,101 @@
+from statistics import NormalDist
+
+import numpy as np
+
+DEFAULT_TARGET_WIDTH = 0.1
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MIN_ROWS = 30
+DEFAULT_STRATA_COLUMN = 'file_path'
+
+class SequentialSampler(object):
+    """Evaluates rows in stratified random order until every metric's mean is known well enough.
+
+    Rows are ordered so that every prefix holds each stratum (e.g. source file) in proportion to its
+    size. After each row the running mean and normal confidence interval of every metric is updated,
+    and sampling stops once each interval is narrower than target_width or lies entirely on one side
+    of the metric's threshold.
+    """
+
+    def __init__(self,
+                 target_width: float = DEFAULT_TARGET_WIDTH,
+                 confidence: float = DEFAULT_CONFIDENCE,
+                 min_rows: int = DEFAULT_MIN_ROWS,
+                 strata_column: str = DEFAULT_STRATA_COLUMN,
+                 seed: int = 0):
+        self.target_width = target_width
+        self.confidence = confidence
+        self.min_rows = min_rows
+        self.strata_column = strata_column
+        self.seed = seed
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.metric_names = None
+        self.thresholds = None
+
+    def order(self, dataset) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        if self.strata_column in dataset.column_names:
+            _, strata = np.unique(np.asarray(dataset[self.strata_column], dtype=str), return_inverse=True)
+        else:
+            strata = np.zeros(len(dataset), dtype=np.int64)
+
+        # Shuffle, then rank rows within their stratum; sorting by (rank + jitter) / stratum size
+        # interleaves the strata proportionally
+        shuffled = rng.permutation(len(dataset))
+        shuffled_strata = strata[shuffled]
+        by_stratum = np.argsort(shuffled_strata, kind='stable')
+        sizes = np.bincount(shuffled_strata)
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        ranks = np.empty(len(dataset), dtype=np.float64)
+        ranks[by_stratum] = np.arange(len(dataset)) - np.repeat(starts, sizes)
+        keys = (ranks + rng.random(len(dataset))) / sizes[shuffled_strata]
+        return shuffled[np.argsort(keys, kind='stable')]
+
+    def start(self, metric_names: list, thresholds: list, lower_is_better: list = None):
+        """Sets the metrics to track. lower_is_better flags the metrics that pass at or below their threshold."""
+        self.metric_names = list(metric_names)
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.lower_is_better = np.zeros(len(self.metric_names), dtype=bool) if lower_is_better is None else np.asarray(lower_is_better, dtype=bool)
+        size = len(self.metric_names)
+        self.n = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.passed = np.zeros(size)
+
+    def update(self, scores: dict):
+        """Adds one row of scores, keyed by metric name, with Welford's update across all metrics at once."""
+        values = np.array([scores.get(name) if scores.get(name) is not None else np.nan for name in self.metric_names],
+                          dtype=np.float64)
+        seen = ~np.isnan(values)
+        values = np.where(seen, values, 0.0)
+        self.n += seen
+        delta = np.where(seen, values - self.mean, 0.0)
+        self.mean += np.divide(delta, self.n, out=np.zeros_like(delta), where=self.n > 0)
+        self.m2 += delta * np.where(seen, values - self.mean, 0.0)
+        self.passed += seen & np.where(self.lower_is_better, values <= self.thresholds, values >= self.thresholds)
+
+    def intervals(self):
+        variance = np.divide(self.m2, self.n - 1, out=np.full_like(self.m2, np.inf), where=self.n > 1)
+        half_width = self.z * np.sqrt(variance / np.maximum(self.n, 1))
+        return self.mean - half_width, self.mean + half_width
+
+    def done(self) -> bool:
+        if self.metric_names is None:
+            return False
+        low, high = self.intervals()
+        settled = ((high - low) <= self.target_width) | (low > self.thresholds) | (high < self.thresholds)
+        return bool(np.all((self.n >= self.min_rows) & settled))
+
+    def summary(self) -> dict:
+        low, high = self.intervals()
+        pass_rate = np.divide(self.passed, self.n, out=np.zeros_like(self.passed), where=self.n > 0)
+        return {
+            name: {
+                'rows': int(self.n[i]),
+                'mean': float(self.mean[i]),
+                'ci_low': float(low[i]),
+                'ci_high': float(high[i]),
+                'threshold': float(self.thresholds[i]),
+                'pass_rate': float(pass_rate[i]),
+            }
+            for i, name in enumerate(self.metric_names)
+        }
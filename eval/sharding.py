@@ -0,0 +1,213 @@
+"""Sharded evaluation: split a dataset by row hash, evaluate the shards in parallel and merge the results.
+
+Run every shard as a local worker process and merge them with
+`python -m eval.sharding launch --dataset <parquet> --shards 8`. To spread the shards over several
+machines, run `python -m eval.sharding run --shard <i>` on each with the same dataset, shard count,
+output directory and parent run id, then `python -m eval.sharding merge` once all of them are done.
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import mlflow
+from datasets import Dataset as ds
+
+import config
+from datagen.utils.sink import DEFAULT_READ_BATCH_SIZE, dataset_hash as get_dataset_hash, open_dataset
+from eval.results import results_table, read_results, write_results, metric_means
+
+DEFAULT_SHARD_DIR = "datagen/qac_out/shards"
+# Settings that change what a shard's results are, a shard evaluated under other values is rerun
+FINGERPRINT_KEYS = {
+    'DATAGEN': ['GEN_PROVIDER', 'MODEL', 'AZURE_MODEL', 'VERTEX_MODEL'],
+    'EVAL': ['EVAL_TESTS', 'EVAL_PROVIDER', 'MODEL', 'AZURE_DEPLOYMENT', 'AZURE_MODEL', 'PRESCREEN', 'FUSED_GEVAL',
+             'CONTEXT_TOKEN_BUDGET'],
+}
+
+def config_fingerprint() -> str:
+    """Returns a hash of the FINGERPRINT_KEYS settings of the current config."""
+    settings = {section: {key: config.config.get(section, {}).get(key) for key in keys}
+                for section, keys in FINGERPRINT_KEYS.items()}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+def row_shard(question: str, context: str, num_shards: int) -> int:
+    """Returns the shard of a row, which depends only on its question and context."""
+    digest = hashlib.sha256(f"{question}\x1f{context}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % num_shards
+
+def shard_indices(dataset: ds, shard_index: int, num_shards: int) -> list:
+    # Only the two hashed columns are read, a batch at a time
+    indices = []
+    offset = 0
+    for batch in dataset.select_columns(['question', 'context']).iter(batch_size=DEFAULT_READ_BATCH_SIZE):
+        indices.extend(offset + i for i, (question, context) in enumerate(zip(batch['question'], batch['context']))
+                       if row_shard(question, context, num_shards) == shard_index)
+        offset += len(batch['question'])
+    return indices
+
+def shard_paths(output_dir: str, shard_index: int, num_shards: int):
+    base = os.path.join(output_dir, f"shard-{shard_index:05d}-of-{num_shards:05d}")
+    return f"{base}.parquet", f"{base}.manifest.json"
+
+def load_shard_manifest(output_dir: str, shard_index: int, num_shards: int):
+    _, manifest_path = shard_paths(output_dir, shard_index, num_shards)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def write_json(path: str, data):
+    # Written to a temporary file first, so a crashed worker never leaves a truncated file behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def run_shard(dataset_path: str, shard_index: int, num_shards: int, output_dir: str = DEFAULT_SHARD_DIR,
+              parent_run_id: str = None) -> dict:
+    """Evaluates one shard of the dataset and writes its results followed by its manifest.
+
+    A shard whose manifest already matches the dataset and the eval config is skipped, so rerunning a
+    failed launch only evaluates the missing shards. The shard's MLflow run is nested under parent_run_id when given.
+    """
+    from eval.eval_tests import base_tests, get_eval_options
+
+    dataset_hash = get_dataset_hash(dataset_path)
+    fingerprint = config_fingerprint()
+    manifest = load_shard_manifest(output_dir, shard_index, num_shards)
+    if manifest is not None and manifest['dataset_hash'] == dataset_hash and manifest.get('config_fingerprint') == fingerprint:
+        print(f"Shard {shard_index}/{num_shards} already complete, skipping")
+        return manifest
+
+    dataset = open_dataset(dataset_path)
+    indices = shard_indices(dataset, shard_index, num_shards)
+    print(f"Shard {shard_index}/{num_shards}: {len(indices)} of {len(dataset)} rows")
+
+    options = get_eval_options()
+    if options['sampler'] is not None:
+        # Per-shard estimates can't be merged into one confidence interval, so every row is judged
+        print("SAMPLE is ignored in sharded runs")
+        options['sampler'] = None
+
+    tags = {"shard": f"{shard_index}/{num_shards}"}
+    if parent_run_id:
+        tags["mlflow.parentRunId"] = parent_run_id
+
+    started_at = datetime.now().strftime('%Y%m%d_%H%M%S')
+    test_results = base_tests(eval_dataset=dataset.select(indices), mlflow_tags=tags, **options)
+    for row_index, test_case_dict in zip(indices, test_results):
+        test_case_dict['row_index'] = row_index
+
+    os.makedirs(output_dir, exist_ok=True)
+    results_path, manifest_path = shard_paths(output_dir, shard_index, num_shards)
+    write_results(results_table(test_results), results_path)
+    manifest = {
+        "shard_index": shard_index,
+        "num_shards": num_shards,
+        "dataset_path": dataset_path,
+        "dataset_hash": dataset_hash,
+        "config_fingerprint": fingerprint,
+        "rows": len(test_results),
+        "results_path": os.path.basename(results_path),
+        "run_id": mlflow.last_active_run().info.run_id,
+        "parent_run_id": parent_run_id,
+        "started_at": started_at,
+        "finished_at": datetime.now().strftime('%Y%m%d_%H%M%S'),
+    }
+    write_json(manifest_path, manifest)
+    return manifest
+
+def merge_shards(num_shards: int, output_dir: str = DEFAULT_SHARD_DIR, merged_path: str = None,
+                 parent_run_id: str = None):
+    """Combines the results of every shard into one file, in dataset order, and logs it to the parent run.
+
+    Returns the merged results as an Arrow table. The file is also exported in EVAL.EXPORT_FORMATS.
+
+    Raises ValueError if a shard is missing, or was evaluated against a different dataset or eval config.
+    """
+    manifests = [load_shard_manifest(output_dir, i, num_shards) for i in range(num_shards)]
+    missing = [i for i, manifest in enumerate(manifests) if manifest is None]
+    if missing:
+        raise ValueError(f"Shard(s) {missing} of {num_shards} have no manifest in {output_dir}")
+    if len({manifest['dataset_hash'] for manifest in manifests}) > 1:
+        raise ValueError(f"The shards in {output_dir} were evaluated against different datasets")
+    if len({manifest.get('config_fingerprint') for manifest in manifests}) > 1:
+        raise ValueError(f"The shards in {output_dir} were evaluated with different eval configs, rerun the stale ones")
+
+    import pyarrow as pa
+
+    tables = [read_results(os.path.join(output_dir, manifest['results_path'])) for manifest in manifests]
+    # An empty shard has no metric columns, it is left out unless every shard is empty
+    tables = [table for table in tables if table.num_rows] or tables[:1]
+    merged = pa.concat_tables(tables).sort_by('row_index') if tables[0].num_rows else tables[0]
+
+    if merged_path is None:
+        current_date = datetime.now().strftime('%Y%m%d_%H%M%S')
+        merged_path = f"datagen/qac_out/eval_results_{current_date}.parquet"
+    paths = write_results(merged, merged_path, config.config['EVAL'].get('EXPORT_FORMATS', []))
+    print(f"Merged {merged.num_rows} rows from {num_shards} shard(s) into {merged_path}")
+
+    parent_run_id = parent_run_id or manifests[0]['parent_run_id']
+    with mlflow.start_run(run_id=parent_run_id):
+        mlflow.log_params({"shards": num_shards, "rows": merged.num_rows})
+        mlflow.log_metrics({f"{name}.mean": mean for name, mean in metric_means(merged).items()})
+        for path in paths:
+            mlflow.log_artifact(path)
+
+    return merged
+
+def launch(dataset_path: str, num_shards: int, workers: int = 0, output_dir: str = DEFAULT_SHARD_DIR,
+           merged_path: str = None):
+    """Runs every shard in its own worker process, at most workers at a time, then merges them."""
+    workers = workers or num_shards
+    with mlflow.start_run(run_name=f"sharded-{num_shards}") as parent:
+        parent_run_id = parent.info.run_id
+
+    def run_worker(shard_index):
+        return subprocess.run([sys.executable, '-m', 'eval.sharding', 'run',
+                               '--dataset', dataset_path,
+                               '--shards', str(num_shards),
+                               '--shard', str(shard_index),
+                               '--output-dir', output_dir,
+                               '--parent-run-id', parent_run_id]).returncode
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return_codes = list(executor.map(run_worker, range(num_shards)))
+
+    failed = [i for i, return_code in enumerate(return_codes) if return_code != 0]
+    if failed:
+        raise RuntimeError(f"Shard(s) {failed} failed, rerun the launch to retry them")
+
+    return merge_shards(num_shards, output_dir, merged_path, parent_run_id)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['launch', 'run', 'merge'])
+    parser.add_argument('--dataset', help="Parquet dataset produced by datagen, or a JSON Lines one")
+    parser.add_argument('--shards', type=int, default=config.config['EVAL'].get('SHARDS', 1))
+    parser.add_argument('--shard', type=int, help="shard to evaluate, for the run command")
+    parser.add_argument('--workers', type=int, default=config.config['EVAL'].get('SHARD_WORKERS', 0),
+                        help="worker processes of the launch command (0 runs every shard at once)")
+    parser.add_argument('--output-dir', default=config.config['EVAL'].get('SHARD_DIR', DEFAULT_SHARD_DIR))
+    parser.add_argument('--parent-run-id', help="MLflow run the shard runs are nested under")
+    parser.add_argument('--output', help="merged results file")
+    args = parser.parse_args()
+
+    if args.command in ('launch', 'run') and not args.dataset:
+        parser.error(f"{args.command} requires --dataset")
+    if args.command == 'launch':
+        launch(args.dataset, args.shards, args.workers, args.output_dir, args.output)
+    elif args.command == 'run':
+        if args.shard is None:
+            parser.error("run requires --shard")
+        run_shard(args.dataset, args.shard, args.shards, args.output_dir, args.parent_run_id)
+    else:
+        merge_shards(args.shards, args.output_dir, args.output, args.parent_run_id)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import time
+import threading
+
+MAX_METRICS_PER_BATCH = 1000
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_TABLE_ARTIFACT = 'eval_rows.json'
+
+class BatchLogger(object):
+    """Buffers per-row MLflow metrics and text fields for a run.
+
+    Metrics are sent with log_batch from a background thread every flush_interval seconds, so rows
+    never wait on the tracking server. Long text fields (prompt, context, output, reasons) would
+    exceed param size limits and are written once on close as a single table artifact.
+    """
+
+    def __init__(self, run_id, flush_interval=DEFAULT_FLUSH_INTERVAL, table_artifact=DEFAULT_TABLE_ARTIFACT):
+        # Imported here, so reading DEFAULT_FLUSH_INTERVAL does not pull in mlflow
+        from mlflow.entities import Metric
+        from mlflow.tracking import MlflowClient
+
+        self.client = MlflowClient()
+        self._metric = Metric
+        self.run_id = run_id
+        self.flush_interval = flush_interval
+        self.table_artifact = table_artifact
+        self._metrics = []
+        self._rows = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._thread.start()
+
+    def log_metrics(self, metrics: dict, step: int):
+        timestamp = int(time.time() * 1000)
+        with self._lock:
+            for key, value in metrics.items():
+                if value is not None:
+                    self._metrics.append(self._metric(key, float(value), timestamp, step))
+
+    def log_row(self, row: dict):
+        with self._lock:
+            self._rows.append(row)
+
+    def flush(self):
+        with self._lock:
+            metrics, self._metrics = self._metrics, []
+        for start in range(0, len(metrics), MAX_METRICS_PER_BATCH):
+            batch = metrics[start:start + MAX_METRICS_PER_BATCH]
+            try:
+                self.client.log_batch(self.run_id, metrics=batch)
+            except Exception as e:
+                print(f"MLflow log_batch failed, retrying on next flush: {e}")
+                with self._lock:
+                    self._metrics = metrics[start:] + self._metrics
+                return
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        if self._rows:
+            import pandas as pd
+
+            self.client.log_table(self.run_id, data=pd.DataFrame(self._rows), artifact_file=self.table_artifact)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from importlib import metadata
+
+DEFAULT_VERDICT_STORE_PATH = './.cache/verdicts.sqlite'
+
+# Bumped when the key layout changes, so old verdicts stop matching instead of being misread
+KEY_VERSION = 2
+# How a verdict was produced: by the metric itself, or by the fused judge along with other GEval metrics
+SINGLE = 'single'
+FUSED = 'fused'
+METRIC_CONFIG_ATTRIBUTES = ['name', 'threshold', 'criteria', 'evaluation_steps', 'evaluation_params',
+                            'include_reason', 'strict_mode']
+TEST_CASE_ATTRIBUTES = ['input', 'actual_output', 'expected_output', 'context', 'retrieval_context']
+
+def deepeval_version():
+    try:
+        return metadata.version('deepeval')
+    except metadata.PackageNotFoundError:
+        return None
+
+def judge_name(metric):
+    model = getattr(metric, 'model', None)
+    if model is None:
+        return None
+    inner = getattr(model, 'model', model)
+    # The deployment tells Azure judges apart that report the same model name
+    deployment = getattr(inner, 'deployment_name', None)
+    name = model.get_model_name() if hasattr(model, 'get_model_name') else getattr(model, 'model_name', None)
+    return f"{name or type(inner).__name__}@{deployment}" if deployment else name or type(inner).__name__
+
+def metric_config(metric) -> dict:
+    config = {'class': type(metric).__name__, 'judge': judge_name(metric)}
+    for attribute in METRIC_CONFIG_ATTRIBUTES:
+        config[attribute] = getattr(metric, attribute, None)
+    return config
+
+class VerdictStore(object):
+    """On-disk store of metric verdicts, shared across runs.
+
+    A verdict is keyed by a hash of the metric class and config (threshold, criteria, steps), the
+    judge model, the scoring mode (single or fused), the deepeval version and the test case fields.
+    A metric is only re-judged when one of those changed.
+    """
+
+    def __init__(self, path: str = DEFAULT_VERDICT_STORE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.salt = json.dumps([KEY_VERSION, deepeval_version()])
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, "
+            "metric TEXT NOT NULL, "
+            "score REAL, "
+            "reason TEXT, "
+            "success INTEGER, "
+            "created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def key(self, metric, test_case, mode: str = SINGLE) -> str:
+        fields = {attribute: getattr(test_case, attribute, None) for attribute in TEST_CASE_ATTRIBUTES}
+        payload = json.dumps([self.salt, mode, metric_config(metric), fields], sort_keys=True,
+                             default=lambda value: getattr(value, 'value', str(value)))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def lookup(self, metrics: list, test_case, modes: dict = None) -> dict:
+        """Returns {metric name: (score, reason, success)} for the (name, metric) pairs already judged.
+
+        modes maps a metric name to the mode it would be scored in, SINGLE for those left out.
+        """
+        modes = modes or {}
+        keys = {name: self.key(metric, test_case, modes.get(name, SINGLE)) for name, metric in metrics}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, score, reason, success FROM verdicts WHERE key IN ({','.join('?' * len(keys))})",
+                list(keys.values())
+            ).fetchall() if keys else []
+            verdicts = {row[0]: (row[1], row[2], None if row[3] is None else bool(row[3])) for row in rows}
+            found = {name: verdicts[key] for name, key in keys.items() if key in verdicts}
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def update(self, metrics: list, test_case, modes: dict = None) -> None:
+        """Stores the verdicts of the given (name, metric) pairs, measured on test_case in their modes."""
+        modes = modes or {}
+        now = time.time()
+        rows = []
+        for name, metric in metrics:
+            success = getattr(metric, 'success', None)
+            rows.append((self.key(metric, test_case, modes.get(name, SINGLE)), name, metric.score, metric.reason,
+                         None if success is None else int(success), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO verdicts (key, metric, score, reason, success, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM verdicts")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+        }
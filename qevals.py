@@ -0,0 +1,148 @@
+"""Command line interface of qevals.
+
+    python -m qevals [--config PATH] [--dry-run] datagen [--data-dir DIR] [--output PATH] [--previous PATH]
+    python -m qevals [--config PATH] [--dry-run] eval [--dataset PATH] [--output PATH] [--shards N] [--workers N]
+    python -m qevals [--config PATH] [--dry-run] report RESULTS... [--baseline RESULTS...] [--slice-by COLUMN...] [--tolerance X] [--output PATH]
+
+The config is read and checked first, then only the modules needed by the configured providers
+and metrics are imported. With --dry-run the command stops there and reports how long it took.
+"""
+import os
+import sys
+import time
+import argparse
+import importlib
+from datetime import datetime
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='qevals', description=__doc__.splitlines()[0])
+    parser.add_argument('--config', help="config file, defaults to config/config.toml")
+    parser.add_argument('--dry-run', action='store_true', help="stop after loading the config and imports")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    datagen_parser = commands.add_parser('datagen', help="generate a synthetic QA dataset from a corpus")
+    datagen_parser.add_argument('--data-dir', help="corpus directory under datagen/data/, defaults to DATAGEN.DATA_DIR")
+    datagen_parser.add_argument('--output', help="Parquet dataset output, defaults to DATAGEN.OUTPUT_PATH or a dated file")
+    datagen_parser.add_argument('--previous', help="earlier dataset to refresh, defaults to DATAGEN.PREVIOUS_PATH")
+
+    eval_parser = commands.add_parser('eval', help="evaluate a dataset with the configured metrics")
+    eval_parser.add_argument('--dataset', help="Parquet or JSON Lines dataset, defaults to EVAL.DATASET_PATH")
+    eval_parser.add_argument('--output', help="Parquet results file, defaults to a dated file in datagen/qac_out/")
+    eval_parser.add_argument('--shards', type=int, help="split the dataset into this many shards, defaults to EVAL.SHARDS")
+    eval_parser.add_argument('--workers', type=int, help="shard worker processes, defaults to EVAL.SHARD_WORKERS")
+
+    report_parser = commands.add_parser('report', help="summarise eval results and compare them with a baseline run")
+    report_parser.add_argument('results', nargs='+', help="result files of the run to report on")
+    report_parser.add_argument('--baseline', nargs='+', help="result files of the run to compare with")
+    report_parser.add_argument('--slice-by', nargs='*', default=[], help="metadata columns to break the scores down by, e.g. file_path")
+    report_parser.add_argument('--tolerance', type=float, help="smallest mean score change counted as a regression")
+    report_parser.add_argument('--output', help="write the full report to this JSON file")
+
+    return parser.parse_args(argv)
+
+def prepare_datagen(args):
+    import config
+    from client.llm_client import LLMClient
+
+    LLMClient.load_provider(config.config['DATAGEN']['GEN_PROVIDER'])
+    importlib.import_module('datagen.datagen')
+    importlib.import_module('pyarrow.parquet')
+    importlib.import_module('langchain.prompts')
+
+def run_datagen(args):
+    import config
+    from datagen.datagen import stream_synthetic_data, refresh_synthetic_data
+
+    data_corpus_dir = args.data_dir or config.config['DATAGEN']['DATA_DIR']
+    gen_provider = config.config['DATAGEN']['GEN_PROVIDER']
+    current_date = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_path = args.output or config.config['DATAGEN'].get('OUTPUT_PATH') or f"./datagen/qac_out/eval_dataset_{current_date}.parquet"
+    previous_path = args.previous or config.config['DATAGEN'].get('PREVIOUS_PATH')
+
+    if previous_path:
+        refresh_synthetic_data(data_corpus_dir, gen_provider, previous_path, output_path)
+    else:
+        stream_synthetic_data(data_corpus_dir, gen_provider, output_path)
+    print(f"Synthetic dataset written to {output_path}")
+
+def prepare_eval(args):
+    import config
+    from client.llm_client import LLMClient
+    from eval.metrics import check_metrics, load_metric_class
+
+    test_list = config.config['EVAL']['EVAL_TESTS']
+    check_metrics(test_list)
+    LLMClient.load_provider(config.config['DATAGEN']['GEN_PROVIDER'])
+    LLMClient.load_provider(config.config['EVAL']['EVAL_PROVIDER'])
+    for name in test_list:
+        load_metric_class(name)
+    for module in ('mlflow', 'datasets', 'pyarrow.parquet', 'deepeval.test_case', 'eval.eval_tests', 'eval.llm_eval'):
+        importlib.import_module(module)
+
+def run_eval(args):
+    import config
+
+    dataset_path = args.dataset or config.config['EVAL'].get('DATASET_PATH')
+    if not dataset_path:
+        sys.exit("qevals: no dataset given, pass --dataset or set EVAL.DATASET_PATH")
+    shards = args.shards or config.config['EVAL'].get('SHARDS', 1)
+    current_date = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_path = args.output or f"datagen/qac_out/eval_results_{current_date}.parquet"
+
+    if shards > 1:
+        from eval.sharding import launch, DEFAULT_SHARD_DIR
+
+        workers = args.workers if args.workers is not None else config.config['EVAL'].get('SHARD_WORKERS', 0)
+        launch(dataset_path, shards, workers, config.config['EVAL'].get('SHARD_DIR', DEFAULT_SHARD_DIR), output_path)
+        return
+
+    from datagen.utils.sink import open_dataset
+    from eval.eval_tests import base_tests, get_eval_options
+    from eval.results import results_table, write_results
+
+    test_results = base_tests(eval_dataset=open_dataset(dataset_path), **get_eval_options())
+    paths = write_results(results_table(test_results), output_path, config.config['EVAL'].get('EXPORT_FORMATS', []))
+    print(f"Results written to {', '.join(paths)}")
+
+def prepare_report(args):
+    importlib.import_module('eval.analytics')
+    importlib.import_module('pyarrow.parquet')
+
+def run_report(args):
+    import json
+    from eval.analytics import DEFAULT_TOLERANCE, build_report, print_report
+
+    tolerance = DEFAULT_TOLERANCE if args.tolerance is None else args.tolerance
+    report = build_report(args.results, args.baseline, args.slice_by, tolerance)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+COMMANDS = {
+    'datagen': (prepare_datagen, run_datagen),
+    'eval': (prepare_eval, run_eval),
+    'report': (prepare_report, run_report),
+}
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Set before the first import of config, which reads the file on import
+    if args.config:
+        os.environ['QEVALS_CONFIG'] = args.config
+
+    prepare, run = COMMANDS[args.command]
+    started = time.perf_counter()
+    try:
+        prepare(args)
+    except (ValueError, FileNotFoundError) as e:
+        sys.exit(f"qevals: {e}")
+    if args.dry_run:
+        print(f"Startup took {time.perf_counter() - started:.2f}s")
+        return
+
+    run(args)
+
+if __name__ == '__main__':
+    main()